@@ -1,9 +1,21 @@
 from decimal import Decimal
-from django.conf import settings
 from shop.models import Product
-from coupons.models import Coupon
+from coupons.cache import get_coupon
+from .storage import get_storage
 
 
+def get_cart(request):
+    """
+    Return the Cart shared by everything that handles this request.
+    The first caller (a view or the context processor) builds it and stores it on the
+    request, every later caller gets the same instance back, so the line items are
+    only materialized once per request.
+    """
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        cart = request._cart = Cart(request)
+    return cart
+
 
 class Cart:
     def __init__(self, request):
@@ -11,20 +23,26 @@ class Cart:
         Initialize the cart.
         """
         self.session = request.session  # Gets the session dict
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # save an empty cart in the session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-
-        self.cart = cart
+        # the lines are kept by the storage selected by the CART_STORAGE setting,
+        # they are all loaded once here and only the changed line is written back
+        self.storage = get_storage(self.session)
+        self.cart = self.storage.load()
+        # Totals are kept up to date on every change, so len(cart) and
+        # get_total_price() don't have to loop over the lines.
+        self.totals = self.storage.load_totals(self.cart)
         # store current applied coupon
         self.coupon_id = self.session.get('coupon_id')
+        self._coupon = None
+        self._coupon_loaded = False
+        # materialized line items (products, Decimal prices, totals), built lazily by _get_items()
+        self._items = None
 
     # Example of self.cart:
     # self.cart = {
     #     '1': {'quantity': 2, 'price': '10.99'},  # Product ID 1
     #     '2': {'quantity': 1, 'price': '5.50'}    # Product ID 2
     # }
+    # and self.totals = {'quantity': 3, 'price': '27.48'}
 
 
     def add(self, product, quantity=1, override_quantity=False):
@@ -38,23 +56,49 @@ class Cart:
         """
         # (Session keys are strings in Django)
         product_id = str(product.id)
-        if product_id not in self.cart:         # First-time addition
-            self.cart[product_id] = {
+        line = self.cart.get(product_id)
+        if line is None:                        # First-time addition
+            line = {
                 'quantity': 0,
                 'price': str(product.price)     # Price locked here
             }
+        # the line is replaced instead of updated in place, so the storage
+        # receives the new values
+        line = dict(line)
+        old_quantity = line['quantity']
         if override_quantity:
-            self.cart[product_id]['quantity'] = quantity    # Replace
+            line['quantity'] = quantity    # Replace
         else:
-            self.cart[product_id]['quantity'] += quantity   # Add/Update
+            line['quantity'] += quantity   # Add/Update
+        self.cart[product_id] = line
+        self._update_totals(line, line['quantity'] - old_quantity)
+        self.storage.save_line(product_id, line, self.totals)
         self.save()
 
 
+    def _update_totals(self, line, quantity_change):
+        """
+        Apply the change of quantity of one line to the stored totals.
+        """
+        self.totals = {
+            'quantity': self.totals['quantity'] + quantity_change,
+            'price': str(
+                Decimal(self.totals['price']) + Decimal(line['price']) * quantity_change
+            ),
+        }
+
+
+    def invalidate(self):
+        """
+        Forget the materialized line items so the next iteration rebuilds them.
+        """
+        self._items = None
+
+
     def save(self):
-        # mark the session as "modified" to ensure persistence which makes sure it gets saved,
-        # this tells Django that the session has changed and needs to be saved
-        # Without this quantity changes might not save properly
-        self.session.modified = True
+        # the storage has written the change (see cart.storage), the cart content
+        # has changed, so the materialized items are stale
+        self.invalidate()
 
 
     def remove(self, product):
@@ -63,44 +107,63 @@ class Cart:
         """
         product_id = str(product.id)
         if product_id in self.cart:
-            del self.cart[product_id]
+            line = self.cart.pop(product_id)
+            self._update_totals(line, -line['quantity'])
+            self.storage.delete_line(product_id, self.totals)
             self.save()
 
 
+    def _get_items(self):
+        """
+        Build the line items once and keep them until the cart is modified.
+        """
+        if self._items is None:
+            # Get all product IDs from the session cart
+            product_ids = self.cart.keys()
+
+            # get the product objects from a database in one query, together with their
+            # translations, so templates reading product.name or product.get_absolute_url
+            # don't trigger one translation query per product.
+            products = Product.objects.filter(
+                id__in=product_ids
+            ).prefetch_related('translations')
+            products = {str(product.id): product for product in products}
+
+            items = []
+            for product_id, line in self.cart.items():
+                product = products.get(product_id)
+                if product is None:
+                    # the product was deleted after being added to the cart
+                    continue
+                # Build a new dict instead of updating the session one, so the
+                # Product instance and the Decimal values never end up in the session.
+                price = Decimal(line['price'])
+                items.append({
+                    'product': product,
+                    'quantity': line['quantity'],
+                    'price': price,
+                    'total_price': price * line['quantity'],
+                })
+            self._items = items
+        return self._items
+
+
     # This __iter__() method will allow you to easily iterate over
     # the items in the cart in views and templates.
     def __iter__(self):
         """
         Iterate over the items in the cart and get the products from the database.
         """
-        # Get all product IDs from the session cart
-        product_ids = self.cart.keys()
-
-        # get the product objects from a database and add them to the cart.
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()     # Avoid modifying the original cart
-
-        # Inject full Product instances into cart items
-        for product in products:
-            cart[str(product.id)]['product'] = product
-            # Now, example:  cart['42'] == {'price': '19.99', 'quantity': 2, 'product': <Product 42>}
-            print(type(cart[str(product.id)]['product']))  # Output: <class 'shop.models.Product'>
-
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            # now item also still has 'product' and 'quantity' which was injected earlier in the add()
-            yield item
-            print(f'item from the __iter__ method: {item}')
-            # Instead of returning a full list, this yields one cart item at a time
-            # (makes the class memory efficient and iterable).
-            # Each item yielded looks like:
-            # {
-            #     'quantity': 2,
-            #     'price': Decimal('10.99'),
-            #     'product': <Product object>,
-            #     'total_price': Decimal('21.98')
-            # }
+        # The products are only fetched the first time the cart is iterated in a request,
+        # later loops (view, templates, recommender) reuse the same items.
+        # Each item yielded looks like:
+        # {
+        #     'quantity': 2,
+        #     'price': Decimal('10.99'),
+        #     'product': <Product object>,
+        #     'total_price': Decimal('21.98')
+        # }
+        yield from self._get_items()
 
 
     # custom __len__() method to return the total number of items stored in the cart.
@@ -108,44 +171,41 @@ class Cart:
         """
         Count all items in the cart.
         """
-        print(f'length of cart: {len(self.cart)} products')
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.totals['quantity']
 
 
     # To calculate the total cost of the items in the cart
     def get_total_price(self):
-        return sum(
-            Decimal(item['price']) * item['quantity'] for item in self.cart.values()
-        )
-    # A generator expression is a compact way to create an iterator — something you can loop over —
-    # - without storing the entire list in memory.
-    # syntax: (expression for item in iterable)
+        # read from the stored totals, see _update_totals()
+        return Decimal(self.totals['price'])
 
 
     # Method to clear the cart session
     def clear(self):
-        # remove cart from session
-        del self.session[settings.CART_SESSION_ID]
+        # remove the cart from its storage
+        self.storage.clear()
+        self.cart = {}  # this instance is shared for the rest of the request, so empty it too
+        self.totals = {'quantity': 0, 'price': '0'}
         self.save()
 
 
     # @property turns a method into something that looks and behaves like a normal attribute, but
     # still runs login when accessed. Here, it's used so you can treat coupon as a simple attribute
-    # of the cart, even though it's actually doing a database fetch.
+    # of the cart. The coupon is looked up once per request (the cart is shared through get_cart())
+    # and comes from the shared cache, so the database is only hit when the coupon isn't cached yet.
     @property
     def coupon(self):
-        if self.coupon_id:
-            try:
-                return Coupon.objects.get(id=self.coupon_id)
-            except Coupon.DoesNotExist:
-                pass
-        return None
+        if not self._coupon_loaded:
+            self._coupon = get_coupon(self.coupon_id)
+            self._coupon_loaded = True
+        return self._coupon
 
 
     def get_discount(self):
-        if self.coupon:
+        coupon = self.coupon
+        if coupon:
             return (
-                self.coupon.discount / Decimal(100)
+                coupon.discount / Decimal(100)
             ) * self.get_total_price()
         return Decimal(0)
 
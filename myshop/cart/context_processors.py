@@ -1,5 +1,6 @@
-from .cart import  Cart
+from .cart import get_cart
 
 
 def cart(request):
-    return {'cart': Cart(request)}
\ No newline at end of file
+    # Reuse the cart of the view (if it already built one) instead of creating a second one.
+    return {'cart': get_cart(request)}
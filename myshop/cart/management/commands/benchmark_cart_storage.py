@@ -0,0 +1,106 @@
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cart import storage
+from cart.cart import Cart
+from shop.management.commands.benchmark_recommender import get_connection
+from shop.models import Category, Product
+
+
+STORAGES = {
+    'session': 'cart.storage.SessionCartStorage',
+    'database': 'cart.storage.DatabaseCartStorage',
+    'redis': 'cart.storage.RedisCartStorage',
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the cart storages: each request loads a database session, changes the '
+        'quantity of one line of a big cart and saves the session like SessionMiddleware. '
+        'The database changes are rolled back and the Redis carts deleted at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=50, help='Lines in the cart.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument(
+            '--storages', nargs='+', choices=STORAGES, default=list(STORAGES)
+        )
+        parser.add_argument(
+            '--fake', action='store_true',
+            help='Use an in-memory fakeredis server instead of the configured Redis.'
+        )
+
+    def handle(self, *args, **options):
+        redis_connection = storage.r
+        if 'redis' in options['storages']:
+            storage.r = get_connection(options['fake'])
+        try:
+            with transaction.atomic():
+                products = self.create_products(options['lines'])
+                self.stdout.write(
+                    f'{options["requests"]} requests on a cart of {options["lines"]} lines'
+                )
+                self.stdout.write(
+                    f'{"storage":<10} {"ms/request":>11} {"queries":>8} {"session bytes":>14}'
+                )
+                for name in options['storages']:
+                    with override_settings(CART_STORAGE=STORAGES[name]):
+                        self.run(name, products, options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            storage.r = redis_connection
+
+    def create_products(self, count):
+        category = Category.objects.create(name='Benchmark', slug='benchmark-cart')
+        return Product.objects.bulk_create([
+            Product(category=category, price=Decimal('9.99'))
+            for _ in range(count)
+        ])
+
+    def request(self, session_key, product, quantity):
+        """
+        One cart_add request: what SessionMiddleware and the view do.
+        Return the size of the session data written, 0 if it isn't saved.
+        """
+        session = SessionStore(session_key)
+        cart = Cart(SimpleNamespace(session=session))
+        cart.add(product, quantity=quantity, override_quantity=True)
+        if session.modified:
+            session.save()
+            return len(session.encode(session._get_session()))
+        return 0
+
+    def run(self, name, products, request_count):
+        session = SessionStore()
+        session.create()
+        for product in products:
+            self.request(session.session_key, product, 1)
+
+        written = 0
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(request_count):
+                product = products[i % len(products)]
+                written += self.request(session.session_key, product, i % 5 + 1)
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{name:<10} {elapsed / request_count * 1000:>11.2f} '
+            f'{len(queries) / request_count:>8.1f} {written / request_count:>14.0f}'
+        )
+
+        # delete the cart, the Redis hash isn't rolled back with the database
+        Cart(SimpleNamespace(session=SessionStore(session.session_key))).clear()
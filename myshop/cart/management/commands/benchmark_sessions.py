@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from shop.models import Category, Product
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class DatabaseTimer:
+    """
+    Database execute wrapper timing the statements of all the threads: the time spent
+    in writes includes the time SQLite makes them wait for the lock of the database file.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.write_seconds = 0
+        self.locked = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                with self.lock:
+                    self.locked += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+                    self.write_seconds += elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the storefront with each session mode (see SESSION_MODE in the settings): '
+        'parallel visitors browse the catalog and add and remove a product from their cart. '
+        'Reports the requests per second, the database queries and the time spent in database '
+        'writes, which includes the SQLite lock waits. The benchmark product is deleted at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', choices=settings.SESSION_ENGINES,
+            default=list(settings.SESSION_ENGINES)
+        )
+        parser.add_argument('--visitors', type=int, default=8, help='Parallel threads.')
+        parser.add_argument('--visits', type=int, default=50, help='Visits per visitor.')
+        parser.add_argument(
+            '--local-cache', action='store_true',
+            help='Keep the cache sessions in process memory instead of Redis.'
+        )
+
+    def handle(self, *args, **options):
+        caches = settings.CACHES
+        if options['local_cache']:
+            caches = {
+                **caches,
+                'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            }
+        category = Category.objects.create(name='Benchmark', slug='benchmark-sessions')
+        product = Product.objects.create(
+            category=category, name='Benchmark', slug='benchmark-sessions',
+            price=Decimal('9.99')
+        )
+        try:
+            self.stdout.write(
+                f'{options["visitors"]} visitors x {options["visits"]} visits '
+                f'(catalog page, add to cart, remove from cart)'
+            )
+            self.stdout.write(
+                f'{"mode":<16} {"req/s":>8} {"queries/req":>12} {"write ms/req":>13} '
+                f'{"locked":>7} {"errors":>7}'
+            )
+            for mode in options['modes']:
+                with override_settings(
+                    SESSION_ENGINE=settings.SESSION_ENGINES[mode], CACHES=caches
+                ):
+                    self.run(mode, product, options['visitors'], options['visits'])
+        finally:
+            category.delete()
+
+    def run(self, mode, product, visitors, visits):
+        timer = DatabaseTimer()
+        urls = [
+            ('get', reverse('shop:product_list'), None),
+            ('post', reverse('cart:cart_add', args=[product.id]), {'quantity': 1, 'override': False}),
+            ('post', reverse('cart:cart_remove', args=[product.id]), None),
+        ]
+
+        def visitor(_):
+            # every visitor keeps its session cookie between its requests
+            client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+            requests = errors = 0
+            try:
+                with connection.execute_wrapper(timer):
+                    for _ in range(visits):
+                        for method, url, data in urls:
+                            response = getattr(client, method)(url, data)
+                            requests += 1
+                            if response.status_code >= 400:
+                                errors += 1
+            finally:
+                # every thread has its own database connection
+                connection.close()
+            return requests, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=visitors) as executor:
+            results = list(executor.map(visitor, range(visitors)))
+        elapsed = time.perf_counter() - start
+
+        requests = sum(r for r, _ in results)
+        errors = sum(e for _, e in results)
+        self.stdout.write(
+            f'{mode:<16} {requests / elapsed:>8.1f} {timer.queries / requests:>12.2f} '
+            f'{timer.write_seconds / requests * 1000:>13.2f} {timer.locked:>7} {errors:>7}'
+        )
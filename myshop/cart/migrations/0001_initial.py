@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shop', '0004_product_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_id', models.CharField(max_length=32)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated'], name='cart_cartli_updated_ef5e4f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartline',
+            constraint=models.UniqueConstraint(fields=('cart_id', 'product'), name='unique_cart_product'),
+        ),
+    ]
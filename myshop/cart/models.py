@@ -1,3 +1,28 @@
 from django.db import models
 
-# Create your models here.
+
+class CartLine(models.Model):
+    """
+    A line of a cart kept in the database (see cart.storage.DatabaseCartStorage).
+    """
+    # the cart id stored in the session
+    cart_id = models.CharField(max_length=32)
+    product = models.ForeignKey(
+        'shop.Product', related_name='cart_lines', on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # also the index used to load a cart
+            models.UniqueConstraint(fields=['cart_id', 'product'], name='unique_cart_product'),
+        ]
+        indexes = [
+            # the abandoned lines are deleted by age
+            models.Index(fields=['updated']),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity}x {self.product_id} in cart {self.cart_id}'
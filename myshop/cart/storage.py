@@ -0,0 +1,186 @@
+import json
+import uuid
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import CartLine
+
+
+# The cart lines look like {'1': {'quantity': 2, 'price': '10.99'}, ...}: product ids and
+# prices are strings so they can be stored as they are in the session, a Redis hash or JSON.
+
+
+def compute_totals(lines):
+    return {
+        'quantity': sum(line['quantity'] for line in lines.values()),
+        'price': str(sum(
+            (Decimal(line['price']) * line['quantity'] for line in lines.values()),
+            Decimal(0)
+        )),
+    }
+
+
+def get_storage(session):
+    """
+    Return an instance of the cart storage selected by the CART_STORAGE setting.
+    """
+    return import_string(settings.CART_STORAGE)(session)
+
+
+class CartStorage:
+    """
+    Where the cart lines are kept. Cart reads them all once per request with load()
+    and writes back only the line that changed with save_line() and delete_line().
+    """
+    def __init__(self, session):
+        self.session = session
+
+    def load(self):
+        raise NotImplementedError
+
+    def load_totals(self, lines):
+        return compute_totals(lines)
+
+    def save_line(self, product_id, line, totals):
+        raise NotImplementedError
+
+    def delete_line(self, product_id, totals):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SessionCartStorage(CartStorage):
+    """
+    The whole cart is kept in the session: any change rewrites the session.
+    The totals are kept next to it so len(cart) doesn't have to loop over the lines.
+    """
+    def load(self):
+        # Nothing is written to the session until the cart is changed: a visitor who
+        # never adds a product doesn't get a session saved (nor a session cookie).
+        return self.session.get(settings.CART_SESSION_ID) or {}
+
+    def load_totals(self, lines):
+        totals = self.session.get(settings.CART_TOTALS_SESSION_ID)
+        if totals is None and lines:
+            # cart saved before the totals were stored, compute them once
+            totals = self.session[settings.CART_TOTALS_SESSION_ID] = compute_totals(lines)
+        return totals or {'quantity': 0, 'price': '0'}
+
+    def save_line(self, product_id, line, totals):
+        self.session.setdefault(settings.CART_SESSION_ID, {})[product_id] = line
+        self.session[settings.CART_TOTALS_SESSION_ID] = totals
+        # mark the session as "modified" to ensure persistence, the cart dict
+        # is changed in place so Django can't notice it by itself
+        self.session.modified = True
+
+    def delete_line(self, product_id, totals):
+        self.session.get(settings.CART_SESSION_ID, {}).pop(product_id, None)
+        self.session[settings.CART_TOTALS_SESSION_ID] = totals
+        self.session.modified = True
+
+    def clear(self):
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.session.pop(settings.CART_TOTALS_SESSION_ID, None)
+
+
+class KeyedCartStorage(CartStorage):
+    """
+    Storage keeping the cart outside the session: only the id of the cart is
+    stored in the session, it is never written again after the cart is created.
+    The id is only created when the first product is added, until then the cart
+    is empty and nothing is read nor written.
+    """
+    def __init__(self, session):
+        super().__init__(session)
+        self.cart_id = session.get(settings.CART_ID_SESSION_ID)
+
+    def create_cart_id(self):
+        if not self.cart_id:
+            self.cart_id = self.session[settings.CART_ID_SESSION_ID] = uuid.uuid4().hex
+        return self.cart_id
+
+
+class DatabaseCartStorage(KeyedCartStorage):
+    """
+    One CartLine row per product: a change inserts, updates or deletes a single row.
+    """
+    def load(self):
+        if not self.cart_id:
+            return {}
+        return {
+            str(product_id): {'quantity': quantity, 'price': str(price)}
+            for product_id, quantity, price in CartLine.objects.filter(
+                cart_id=self.cart_id
+            ).values_list('product_id', 'quantity', 'price')
+        }
+
+    def save_line(self, product_id, line, totals):
+        # a single INSERT ... ON CONFLICT DO UPDATE
+        CartLine.objects.bulk_create(
+            [
+                CartLine(
+                    cart_id=self.create_cart_id(), product_id=int(product_id),
+                    quantity=line['quantity'], price=Decimal(line['price'])
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=['cart_id', 'product'],
+            update_fields=['quantity', 'price', 'updated']
+        )
+
+    def delete_line(self, product_id, totals):
+        CartLine.objects.filter(cart_id=self.cart_id, product_id=int(product_id)).delete()
+
+    def clear(self):
+        if self.cart_id:
+            CartLine.objects.filter(cart_id=self.cart_id).delete()
+
+
+# connect to Redis database, like shop.recommender
+r = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB
+)
+
+
+class RedisCartStorage(KeyedCartStorage):
+    """
+    One Redis hash per cart, one field per product: a change is a single HSET or HDEL.
+    The hash expires CART_TTL seconds after the last change.
+    """
+    def __init__(self, session, connection=None):
+        super().__init__(session)
+        # Use the shared connection unless another one is given (the benchmark passes its own).
+        self.r = connection if connection is not None else r
+
+    def get_key(self):
+        return f'cart:{self.cart_id}'
+
+    def load(self):
+        if not self.cart_id:
+            return {}
+        return {
+            product_id.decode(): json.loads(line)
+            for product_id, line in self.r.hgetall(self.get_key()).items()
+        }
+
+    def save_line(self, product_id, line, totals):
+        self.create_cart_id()
+        key = self.get_key()
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hset(key, product_id, json.dumps(line))
+        pipe.expire(key, settings.CART_TTL)
+        pipe.execute()
+
+    def delete_line(self, product_id, totals):
+        self.r.hdel(self.get_key(), product_id)
+
+    def clear(self):
+        if self.cart_id:
+            self.r.unlink(self.get_key())
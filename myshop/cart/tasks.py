@@ -0,0 +1,29 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CartLine
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def delete_abandoned_cart_lines():
+    """
+    Task to delete the carts kept in the database (see cart.storage.DatabaseCartStorage)
+    that weren't changed for CART_TTL seconds: every line of a cart whose newest line
+    is older than that. Redis carts expire by themselves.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.CART_TTL)
+    # the old lines of the carts without any recent line, so a cart that is still in use
+    # keeps the lines added long ago; both filters use the index on updated
+    deleted, _ = CartLine.objects.filter(updated__lt=cutoff).exclude(
+        cart_id__in=CartLine.objects.filter(updated__gte=cutoff).values('cart_id')
+    ).delete()
+    if deleted:
+        logger.info('Deleted %s lines of abandoned carts', deleted)
+    return deleted
@@ -1,7 +1,7 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 from shop.models import Product
-from .cart import Cart
+from .cart import get_cart
 from .forms import CartAddProductForm
 from coupons.forms import CouponApplyForm
 from shop.recommender import Recommender
@@ -10,7 +10,7 @@ from shop.recommender import Recommender
 
 @require_POST
 def cart_add(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     form = CartAddProductForm(request.POST)
     if form.is_valid():
@@ -27,19 +27,15 @@ def cart_add(request, product_id):
 
 @require_POST
 def cart_remove(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     return redirect('cart:cart_detail')
 
 
 def cart_detail(request):
-    cart = Cart(request)    # Loads current cart from session
-
-    # For Debugging purpose
-    for item in cart:
-        print(f'item["product"].name: {item["product"].name}, item["quantity"]: {item["quantity"]}, '
-              f'item["total_price"]: {item["total_price"]}')
+    # Loads current cart from session, the same instance is later used by the context processor
+    cart = get_cart(request)
 
     # update product quantities
     for item in cart:
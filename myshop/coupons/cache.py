@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from .models import Coupon
+
+
+# How long a coupon stays in the cache. The default cache is kept in Redis and shared
+# by every process, so the post_save/post_delete signals in signals.py remove a changed
+# coupon for all of them: the timeout is only a safety net.
+COUPON_CACHE_TIMEOUT = 60 * 60
+
+# Stored in the cache for ids that don't exist anymore, so a deleted coupon
+# still stuck in a session doesn't hit the database on every request.
+MISSING = 'missing'
+
+
+def get_coupon_cache_key(coupon_id):
+    return f'coupon:{coupon_id}'
+
+
+def get_coupon(coupon_id):
+    """
+    Return the coupon with the given id, or None if it doesn't exist.
+    The coupon is read from the shared cache and only fetched from the
+    database on a cache miss.
+    """
+    if not coupon_id:
+        return None
+    key = get_coupon_cache_key(coupon_id)
+    coupon = cache.get(key)
+    if coupon is None:
+        try:
+            coupon = Coupon.objects.get(id=coupon_id)
+        except Coupon.DoesNotExist:
+            coupon = MISSING
+        cache.set(key, coupon, COUPON_CACHE_TIMEOUT)
+    if coupon == MISSING:
+        return None
+    return coupon
+
+
+def invalidate_coupon(coupon_id):
+    cache.delete(get_coupon_cache_key(coupon_id))
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_coupon
+from .models import Coupon
+
+
+# Drop the cached copy whenever a coupon is edited or deleted (e.g. from the admin),
+# so carts never keep applying an old discount. The cache is shared by every process:
+# it's done after the commit, otherwise another process could read the coupon before the
+# change is committed and put the old one back in the cache.
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, instance, **kwargs):
+    # the id of a deleted instance is set to None once the signals are sent
+    coupon_id = instance.id
+    transaction.on_commit(lambda: invalidate_coupon(coupon_id))
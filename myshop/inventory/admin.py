@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import Stock, StockReservation
+
+
+@admin.register(Stock)
+class StockAdmin(admin.ModelAdmin):
+    list_display = ['product', 'quantity', 'updated']
+    raw_id_fields = ['product']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'product', 'quantity', 'status', 'created', 'expires']
+    list_filter = ['status', 'created', 'expires']
+    raw_id_fields = ['order', 'product']
@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from inventory.models import Stock
+from inventory.stock import InsufficientStock
+from orders.checkout import build_order_items, create_order
+from orders.models import Order, OrderItem
+from shop.models import Category, Product
+
+
+def create_order_read_check_write(order, items):
+    """
+    Checkout with the stock checked in Python: the quantities are read and compared
+    first, and the new quantities written with the order. Kept here to show why it
+    oversells under concurrency: two checkouts can read the same quantity before
+    either of them writes.
+    """
+    stocks = []
+    for item in items:
+        stock = Stock.objects.get(product=item['product'])
+        if stock.quantity < item['quantity']:
+            raise InsufficientStock(item['product'], item['quantity'], stock.quantity)
+        stock.quantity -= item['quantity']
+        stocks.append(stock)
+    with transaction.atomic():
+        order.save()
+        OrderItem.objects.bulk_create(build_order_items(order, items))
+        for stock in stocks:
+            stock.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = (
+        'Run many checkouts of the same product in parallel threads and check that the '
+        'stock is never oversold. The benchmark product and its orders are deleted at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=100, help='Initial units of the product.')
+        parser.add_argument('--checkouts', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=20, help='Parallel threads.')
+        parser.add_argument('--quantity', type=int, default=1, help='Units bought per checkout.')
+
+    def handle(self, *args, **options):
+        category = Category.objects.create(name='Benchmark', slug='benchmark-stock')
+        product = Product.objects.create(
+            category=category, name='Benchmark', slug='benchmark-stock', price=Decimal('9.99')
+        )
+        try:
+            self.stdout.write(
+                f'{options["checkouts"]} checkouts of {options["quantity"]} unit(s), '
+                f'{options["workers"]} threads, {options["stock"]} units in stock'
+            )
+            self.stdout.write(
+                f'{"method":<22} {"sold":>6} {"rejected":>9} {"errors":>7} '
+                f'{"left":>6} {"oversold":>9} {"checkouts/s":>12}'
+            )
+            self.run('conditional update', create_order, product, options)
+            self.run('read, check, write', create_order_read_check_write, product, options)
+        finally:
+            Order.objects.filter(items__product=product).delete()
+            category.delete()
+
+    def run(self, label, create, product, options):
+        Order.objects.filter(items__product=product).delete()
+        Stock.objects.update_or_create(product=product, defaults={'quantity': options['stock']})
+        items = [{'product': product, 'price': product.price, 'quantity': options['quantity']}]
+
+        def checkout(_):
+            try:
+                order = Order(
+                    first_name='Bench', last_name='Mark', email='bench@example.com',
+                    address='Street 1', postal_code='00000', city='City'
+                )
+                create(order, items)
+                return 'sold'
+            except InsufficientStock:
+                return 'rejected'
+            except OperationalError:
+                # e.g. SQLite giving up on a locked database
+                return 'errors'
+            finally:
+                # every thread has its own database connection
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(checkout, range(options['checkouts'])))
+        elapsed = time.perf_counter() - start
+
+        sold = results.count('sold')
+        left = Stock.objects.get(product=product).quantity
+        sold_units = sold * options['quantity']
+        # units sold that were never taken from the stock (lost updates)
+        oversold = max(sold_units - (options['stock'] - left), 0)
+        self.stdout.write(
+            f'{label:<22} {sold:>6} {results.count("rejected"):>9} {results.count("errors"):>7} '
+            f'{left:>6} {oversold:>9} {len(results) / elapsed:>12.1f}'
+        )
@@ -0,0 +1,48 @@
+from django.db import models
+
+
+class Stock(models.Model):
+    # Products without a Stock row are not tracked and can always be ordered.
+    product = models.OneToOneField(
+        'shop.Product', related_name='stock', on_delete=models.CASCADE
+    )
+    # Units that can still be sold. Reserved units are already subtracted, they are
+    # added back if the reservation is released.
+    quantity = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.product} ({self.quantity})'
+
+
+class StockReservation(models.Model):
+    # A reservation holds units of a product for an order until it is paid (confirmed),
+    # or canceled or expired (released, the units go back to the stock).
+    RESERVED = 'reserved'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (RESERVED, 'Reserved'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+    ]
+
+    order = models.ForeignKey(
+        'orders.Order', related_name='reservations', on_delete=models.CASCADE
+    )
+    product = models.ForeignKey(
+        'shop.Product', related_name='reservations', on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RESERVED)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # the expired reservations are looked up by status and expiry
+            models.Index(fields=['status', 'expires']),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity}x {self.product} for order {self.order_id}'
@@ -0,0 +1,149 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Stock, StockReservation
+
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a product doesn't have enough units left for an order.
+    """
+    def __init__(self, product, requested, available):
+        self.product = product
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f'Only {available} of {product} left in stock, {requested} requested.'
+        )
+
+
+def decrement(product_id, quantity):
+    """
+    Take units of a product from the stock. Return False if there are not enough.
+
+    This is a single conditional UPDATE ... SET quantity = quantity - n WHERE
+    quantity >= n: the check and the write happen in the same statement, so two
+    concurrent checkouts can never both take the last units, and only the stock row
+    of the product is locked, for the duration of the statement.
+    """
+    return Stock.objects.filter(
+        product_id=product_id, quantity__gte=quantity
+    ).update(quantity=F('quantity') - quantity) == 1
+
+
+def increment(product_id, quantity):
+    """
+    Give units of a product back to the stock.
+    """
+    Stock.objects.filter(product_id=product_id).update(quantity=F('quantity') + quantity)
+
+
+def reserve(order, items):
+    """
+    Reserve the stock of the cart items for an order, raising InsufficientStock if
+    any product doesn't have enough units. It must run in the transaction that
+    creates the order, so a failure rolls back the order and the units already taken.
+    """
+    quantities = {}
+    products = {}
+    for item in items:
+        product = item['product']
+        quantities[product.id] = quantities.get(product.id, 0) + item['quantity']
+        products[product.id] = product
+    tracked_ids = set(
+        Stock.objects.filter(product_id__in=quantities).values_list('product_id', flat=True)
+    )
+    expires = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    reservations = []
+    # the rows are always updated in the same order, so two checkouts with the same
+    # products can't deadlock on databases with row locks
+    for product_id in sorted(tracked_ids):
+        quantity = quantities[product_id]
+        if not decrement(product_id, quantity):
+            available = Stock.objects.filter(
+                product_id=product_id
+            ).values_list('quantity', flat=True).first()
+            raise InsufficientStock(products[product_id], quantity, available or 0)
+        reservations.append(
+            StockReservation(
+                order=order, product_id=product_id, quantity=quantity, expires=expires
+            )
+        )
+    StockReservation.objects.bulk_create(reservations)
+    return reservations
+
+
+def release(reservations):
+    """
+    Give the units of the reservations still reserved back to the stock.
+    Return how many reservations were released.
+
+    The status is switched with a conditional UPDATE before the units are given
+    back, so a reservation released twice at the same time (by the cancel page and
+    the expiry task) only returns its units once.
+    """
+    released = 0
+    for reservation in reservations:
+        with transaction.atomic():
+            switched = StockReservation.objects.filter(
+                id=reservation.id, status=StockReservation.RESERVED
+            ).update(status=StockReservation.RELEASED)
+            if switched:
+                increment(reservation.product_id, reservation.quantity)
+                released += 1
+    return released
+
+
+def release_order(order_id):
+    """
+    Release the reservations of an order that will not be paid.
+    """
+    return release(
+        StockReservation.objects.filter(order_id=order_id, status=StockReservation.RESERVED)
+    )
+
+
+def release_expired():
+    """
+    Release the reservations of the orders that weren't paid in time.
+    """
+    return release(
+        StockReservation.objects.filter(
+            status=StockReservation.RESERVED, expires__lte=timezone.now()
+        )
+    )
+
+
+def confirm_order(order_id):
+    """
+    Make the reservations of a paid order permanent.
+
+    If a reservation had already expired and was released, its units are taken from
+    the stock again. The order is paid either way, so when the units are gone in the
+    meantime it is logged to be handled by hand.
+    """
+    StockReservation.objects.filter(
+        order_id=order_id, status=StockReservation.RESERVED
+    ).update(status=StockReservation.CONFIRMED)
+    released = StockReservation.objects.filter(
+        order_id=order_id, status=StockReservation.RELEASED
+    )
+    for reservation in released:
+        with transaction.atomic():
+            switched = StockReservation.objects.filter(
+                id=reservation.id, status=StockReservation.RELEASED
+            ).update(status=StockReservation.CONFIRMED)
+            if switched and not decrement(reservation.product_id, reservation.quantity):
+                logger.warning(
+                    'Order %s was paid after its reservation of product %s expired '
+                    'and the stock ran out: %s units oversold',
+                    order_id, reservation.product_id, reservation.quantity
+                )
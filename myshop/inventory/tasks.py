@@ -0,0 +1,27 @@
+import logging
+
+from celery import shared_task
+
+from . import stock
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def release_expired_reservations():
+    """
+    Task to give back to the stock the units reserved by orders that weren't paid in time.
+    """
+    released = stock.release_expired()
+    if released:
+        logger.info('Released %s expired stock reservations', released)
+    return released
+
+
+@shared_task
+def release_order_reservations(order_id):
+    """
+    Task to give back to the stock the units reserved by a canceled order.
+    """
+    return stock.release_order(order_id)
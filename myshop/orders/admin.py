@@ -1,14 +1,16 @@
 import csv
 import datetime
-from django.http import HttpResponse
-from django.contrib import admin
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.contrib import admin, messages
 from .models import Order, OrderItem
 from django.utils.safestring import mark_safe
 from django.urls import reverse
 
 from import_export_celery.admin_actions import create_export_job_action
 from import_export.admin import ImportExportModelAdmin
-from .resources import OrderResource, MinimalOrderResource
+from .resources import OrderResource, MinimalOrderResource, OrderTotalsResource
+from .exporting import CONTENT_TYPES, iter_export, iter_queryset
 
 print(f"OrderResource type: {type(OrderResource)}")
 
@@ -85,6 +87,39 @@ order_payment.short_description = 'Stripe payment'
 # ------ Remove the custom export_to_csv function since the django-import-export library handles this. ------
 
 
+def stream_export(modeladmin, request, queryset, format):
+    """
+    Send the selected orders with their totals to the browser while they are read
+    from the database, for exports small enough to be done within the request.
+    Bigger ones go through "Export with celery".
+    """
+    count = queryset.count()
+    if count > settings.EXPORT_SYNC_MAX_ROWS:
+        modeladmin.message_user(
+            request,
+            f'{count} orders selected, the direct download is limited to '
+            f'{settings.EXPORT_SYNC_MAX_ROWS}: use "Export with celery".',
+            messages.WARNING
+        )
+        return None
+    lines = iter_export(
+        OrderTotalsResource(), iter_queryset(queryset.with_totals()), format
+    )
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = f'attachment; filename=orders.{format}'
+    return response
+
+
+def stream_csv_export(modeladmin, request, queryset):
+    return stream_export(modeladmin, request, queryset, 'csv')
+stream_csv_export.short_description = 'Download as CSV with totals'
+
+
+def stream_jsonl_export(modeladmin, request, queryset):
+    return stream_export(modeladmin, request, queryset, 'jsonl')
+stream_jsonl_export.short_description = 'Download as JSON Lines with totals'
+
+
 def order_detail(obj):
     url = reverse('orders:admin_order_detail', args=[obj.id])
     return mark_safe(f'<a href="{url}">View</a>')
@@ -116,7 +151,7 @@ class OrderAdmin(ImportExportModelAdmin):   # admin.ModelAdmin changed to Import
 
     ]
     list_filter = ['paid', 'created', 'updated']
-    actions = [create_export_job_action]
+    actions = [create_export_job_action, stream_csv_export, stream_jsonl_export]
     inlines = [OrderItemInline]
 
 
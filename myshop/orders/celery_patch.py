@@ -2,81 +2,106 @@
 Patch for django-import-export-celery to fix 'str' object is not callable error
 """
 from celery import shared_task
-from import_export_celery.models import ImportJob
+from celery.exceptions import Ignore
+from django.conf import settings
+from import_export_celery.models import ExportJob, ImportJob
 from importlib import import_module
 import tablib
 import logging
 from django.utils import timezone
+from .columnar import Parquet, register_format, run_parquet_export
+from .exporting import run_streaming_export
+from .importing import ImportRangeBusy, run_streaming_import
 
 
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def patched_run_import_job(pk, dry_run=True):
+
+def get_resource(import_job):
+    """
+    Create the resource configured in IMPORT_EXPORT_CELERY_MODELS for the model of the job.
+    """
+    # Get the resource class from the settings
+    from django.conf import settings
+    model_config = None
+
+    logger.info(f"Looking for model: '{import_job.model}'")
+    logger.info(f"Available configurations: {list(settings.IMPORT_EXPORT_CELERY_MODELS.keys())}")
+    logger.info(f"Model split result: {import_job.model.split('.')}")
+
+    if '.' in import_job.model:
+        # Full path like "orders.Order"
+        app_label, model_name = import_job.model.rsplit('.', 1)
+        match_condition = lambda config: (config['app_label'] == app_label and
+                                          config['model_name'] == model_name)
+    else:
+        # Just model name like "Order"
+        model_name = import_job.model   # This gets "Captured" by the lambda
+        match_condition = lambda config: config['model_name'] == model_name
+        # Lambda now "remembers" that model_name = "Order"
+
+    for config_key, config in settings.IMPORT_EXPORT_CELERY_MODELS.items():
+        if match_condition(config):
+            model_config = config
+            logger.info(f"Found matching config: {config_key}")
+            break
+    # The above if match_condition(config):
+    # This expands to:
+    # if (lambda config: config['model_name'] == model_name)(config)
+    # Which becomes:
+    # if (lambda config: config['model_name'] == "Order")(config)
+    # When we call it with config, it substitutes:
+    # if config['model_name'] == "Order"
+    # Which evaluates to:
+    # "Order" == "Order"
+
+    if not model_config:
+        raise ValueError(f"No configuration found for model {import_job.model}")
+
+    # Import the resource class
+    resource_path = model_config['resource']
+    if callable(resource_path):
+        resource_class = resource_path()
+        # calling get_order_resource() in settings.py
+        # directly assigning the OrderResource class from the settings.py instead of the string
+        # To remove the 'str' object not callable errors
+    else:
+        module_name, class_name = resource_path.rsplit('.', 1)
+        module = import_module(module_name)
+        resource_class = getattr(module, class_name)
+
+    # Create resource instance
+    resource = resource_class()
+    logger.info(f"Created resource class: {resource_class}")
+    return resource
+
+
+def already_succeeded(task):
+    """
+    Whether the running task has already finished once: an acks_late task is delivered
+    again if its worker goes away between storing the result and acknowledging the
+    message. Tasks called directly or eagerly have no stored result.
+    """
+    request = task.request
+    return bool(request.id) and not request.is_eager and task.AsyncResult(request.id).successful()
+
+
+# acks_late with reject_on_worker_lost: if the worker dies during the import the task is
+# delivered again, and the CSV import resumes from its last committed chunk.
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def patched_run_import_job(self, pk, dry_run=True):
     """
     Patched version of run_import_job that handles serialization properly
     """
+    if already_succeeded(self):
+        # the import would start over
+        raise Ignore()
     try:
         import_job = ImportJob.objects.get(pk=pk)
         logger.info(f"Processing import job {pk}, dry_run={dry_run}")
 
-        # Get the resource class from the settings
-        from django.conf import settings
-        model_config = None
-
-        logger.info(f"Looking for model: '{import_job.model}'")
-        logger.info(f"Available configurations: {list(settings.IMPORT_EXPORT_CELERY_MODELS.keys())}")
-        logger.info(f"Model split result: {import_job.model.split('.')}")
-
-        if '.' in import_job.model:
-            # Full path like "orders.Order"
-            app_label, model_name = import_job.model.rsplit('.', 1)
-            match_condition = lambda config: (config['app_label'] == app_label and
-                                              config['model_name'] == model_name)
-        else:
-            # Just model name like "Order"
-            model_name = import_job.model   # This gets "Captured" by the lambda
-            match_condition = lambda config: config['model_name'] == model_name
-            # Lambda now "remembers" that model_name = "Order"
-
-        for config_key, config in settings.IMPORT_EXPORT_CELERY_MODELS.items():
-            if match_condition(config):
-                model_config = config
-                logger.info(f"Found matching config: {config_key}")
-                break
-        # The above if match_condition(config):
-        # This expands to:
-        # if (lambda config: config['model_name'] == model_name)(config)
-        # Which becomes:
-        # if (lambda config: config['model_name'] == "Order")(config)
-        # When we call it with config, it substitutes:
-        # if config['model_name'] == "Order"
-        # Which evaluates to:
-        # "Order" == "Order"
-
-        if not model_config:
-            raise ValueError(f"No configuration found for model {import_job.model}")
-
-        # Import the resource class
-        resource_path = model_config['resource']
-        if callable(resource_path):
-            resource_class = resource_path()
-            # calling get_order_resource() in settings.py
-            # directly assigning the OrderResource class from the settings.py instead of the string
-            # To remove the 'str' object not callable errors
-        else:
-            module_name, class_name = resource_path.rsplit('.', 1)
-            module = import_module(module_name)
-            resource_class = getattr(module, class_name)
-
-        # Create resource instance
-        resource = resource_class()
-        logger.info(f"Created resource class: {resource_class}")
-
-        # Read the file content
-        with import_job.file.open('r') as f:
-            file_content = f.read()
+        resource = get_resource(import_job)
 
         # create dataset
         dataset = tablib.Dataset()
@@ -93,6 +118,16 @@ def patched_run_import_job(pk, dry_run=True):
         # Get the correct format for tablib
         tablib_format = format_mapping.get(import_job.format, import_job.format)
         logger.info(f"Original format: '{import_job.format}', Using: '{tablib_format}'")
+
+        if tablib_format == 'csv':
+            # CSV files are read and imported chunk by chunk, with the progress saved
+            # after each chunk so a crashed import resumes where it stopped.
+            return run_streaming_import(import_job, resource, dry_run)
+
+        # Other formats can't be read incrementally: read the file content
+        with import_job.file.open('r') as f:
+            file_content = f.read()
+
         # Use the converted format
         dataset.load(file_content, format=tablib_format)
         logger.info(f"Loaded dataset with {len(dataset)} rows")
@@ -153,6 +188,11 @@ def patched_run_import_job(pk, dry_run=True):
             'dry_run': dry_run
         }
 
+    except ImportRangeBusy as e:
+        # delivered again while another worker imports the file: come back when it has
+        # finished, or when its claim has expired if the worker is gone
+        raise self.retry(exc=e, countdown=settings.IMPORT_CLAIM_TIMEOUT, max_retries=None)
+
     except Exception as e:
         logger.error(f"Import job {pk} failed: {str(e)}", exc_info=True)
         try:
@@ -170,9 +210,58 @@ def patched_run_import_job(pk, dry_run=True):
         raise
 
 
+# Formats of the export jobs written row by row (see orders.exporting), the others
+# are built in memory by the original task
+STREAMING_EXPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/json': 'json',
+    Parquet.CONTENT_TYPE: 'parquet',
+}
+
+
+@shared_task
+def patched_run_export_job(pk):
+    """
+    Patched version of run_export_job streaming CSV, JSON and Parquet exports to the file
+    of the job instead of building the whole dataset in memory first.
+    """
+    export_job = ExportJob.objects.get(pk=pk)
+    format = STREAMING_EXPORT_FORMATS.get(export_job.format)
+    if format == 'parquet' and export_job.model != 'order':
+        # the Parquet columns are those of the orders, other models are exported
+        # from their dataset by the original task
+        format = None
+    if format is None:
+        return original_run_export_job(pk)
+    logger.info(f"Processing export job {pk}, format={format}")
+    try:
+        resource = export_job.get_resource_class()()
+        if format == 'parquet':
+            run_parquet_export(export_job, resource)
+        else:
+            run_streaming_export(export_job, resource, format)
+    except Exception as e:
+        logger.error(f"Export job {pk} failed: {str(e)}", exc_info=True)
+        ExportJob.objects.filter(pk=pk).update(job_status=f"Export error: {str(e)}"[:160])
+        raise
+    if export_job.email_on_completion:
+        send_export_job_completion_mail(export_job)
+
+
 # Replace the original task with our patched version
 import import_export_celery.tasks
+import import_export_celery.models.exportjob
+import import_export_celery.models.importjob
+from import_export_celery.tasks import send_export_job_completion_mail
+original_run_export_job = import_export_celery.tasks.run_export_job
+# The admin actions ("Perform import", "Run export job") call the tasks of the tasks
+# module, saving a new import or export job calls the ones imported in its models module
 import_export_celery.tasks.run_import_job = patched_run_import_job
+import_export_celery.models.importjob.run_import_job = patched_run_import_job
+import_export_celery.tasks.run_export_job = patched_run_export_job
+import_export_celery.models.exportjob.run_export_job = patched_run_export_job
+# Offer the Parquet format of orders.columnar if pyarrow is installed
+register_format()
 
 # For debugging:
 logger.info(f"PATCHED LOADED: {patched_run_import_job}")
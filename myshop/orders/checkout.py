@@ -0,0 +1,38 @@
+from django.db import transaction
+
+from inventory.stock import reserve
+from .models import OrderItem
+
+
+def build_order_items(order, items):
+    """
+    Build the unsaved OrderItem instances of an order from the cart items,
+    each a dict with the product, its price at the time of the order and the quantity.
+    """
+    return [
+        OrderItem(
+            order=order,
+            product=item['product'],
+            price=item['price'],
+            quantity=item['quantity']
+        )
+        for item in items
+    ]
+
+
+def create_order(order, items):
+    """
+    Save the order and all its items in a single transaction: one INSERT for the
+    order and one bulk INSERT for the items, whatever the number of cart lines.
+    Either everything is written or nothing is, a failure never leaves an order
+    with part of its items.
+
+    The stock of the items is reserved in the same transaction, raising
+    inventory.stock.InsufficientStock if a product doesn't have enough units left.
+    """
+    items = list(items)
+    with transaction.atomic():
+        order.save()
+        OrderItem.objects.bulk_create(build_order_items(order, items))
+        reserve(order, items)
+    return order
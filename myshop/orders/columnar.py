@@ -0,0 +1,226 @@
+"""
+Parquet export of orders and order items for analytics.
+
+The rows are read with values_list(), without creating model instances nor going through
+the widgets of the resources, and written column by column in batches of
+EXPORT_PARQUET_ROW_GROUP_SIZE rows, one Parquet row group per batch: only one batch is
+in memory at a time. The columns keep their types (integers, booleans, timestamps,
+decimals) instead of being formatted as text like in CSV.
+
+pyarrow is optional: without it the Parquet format isn't offered.
+"""
+import json
+import logging
+from decimal import Decimal
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from import_export.formats import base_formats
+from import_export_celery.models import ExportJob
+
+from .exporting import iter_by_pks, iter_queryset, save_export, spooled_file
+from .models import Order
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+# (column, type) of the exported files, the columns are model fields read with values_list()
+ORDER_COLUMNS = [
+    ('id', 'int64'),
+    ('first_name', 'string'),
+    ('last_name', 'string'),
+    ('email', 'string'),
+    ('address', 'string'),
+    ('postal_code', 'string'),
+    ('city', 'string'),
+    ('paid', 'bool'),
+    ('created', 'timestamp'),
+    ('updated', 'timestamp'),
+    ('stripe_id', 'string'),
+    ('coupon_id', 'int64'),
+    ('discount', 'int64'),
+]
+# added to ORDER_COLUMNS from the subtotal annotation of Order.objects.with_totals()
+TOTAL_COLUMNS = [
+    ('subtotal', 'money'),
+    ('discount_amount', 'money'),
+    ('total', 'money'),
+]
+ORDER_ITEM_COLUMNS = [
+    ('id', 'int64'),
+    ('order_id', 'int64'),
+    ('product_id', 'int64'),
+    ('price', 'money'),
+    ('quantity', 'int64'),
+]
+
+DISCOUNT = [name for name, _ in ORDER_COLUMNS].index('discount')
+
+
+def get_schema(columns):
+    types = {
+        'int64': pa.int64(),
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        # the database returns aware datetimes in UTC (USE_TZ)
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'money': pa.decimal128(12, 2),
+    }
+    return pa.schema([(name, types[type]) for name, type in columns])
+
+
+def get_order_columns(with_totals):
+    return ORDER_COLUMNS + TOTAL_COLUMNS if with_totals else ORDER_COLUMNS
+
+
+def get_order_values(queryset, with_totals):
+    """
+    The values_list() of the orders with the columns of get_order_columns(), but for
+    discount_amount and total which are added by add_totals().
+    """
+    names = [name for name, _ in ORDER_COLUMNS]
+    if with_totals:
+        return queryset.with_totals().values_list(*names, 'subtotal')
+    return queryset.values_list(*names)
+
+
+def add_totals(rows):
+    """
+    Add the discount amount and the total to rows ending with the subtotal, computed
+    like Order.get_discount() and Order.get_total_cost().
+    """
+    for row in rows:
+        subtotal = row[-1]
+        discount = subtotal * (Decimal(row[DISCOUNT]) / Decimal(100))
+        yield row + (discount.quantize(CENT), (subtotal - discount).quantize(CENT))
+
+
+def iter_record_batches(rows, schema, batch_size=None):
+    """
+    Group the rows in record batches of batch_size rows, turned from rows to columns.
+    """
+    batch_size = batch_size or settings.EXPORT_PARQUET_ROW_GROUP_SIZE
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        columns = zip(*batch)
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+def write_parquet(rows, columns, f, batch_size=None):
+    """
+    Write the rows to the file f in Parquet, one row group per batch of rows.
+    Return the number of rows written.
+    """
+    schema = get_schema(columns)
+    count = 0
+    with pq.ParquetWriter(f, schema, compression='snappy') as writer:
+        for batch in iter_record_batches(rows, schema, batch_size):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+def write_orders(queryset, f, with_totals=False, chunk_size=None):
+    """
+    Write the orders of queryset to the file f in Parquet, reading them from the
+    database chunk_size at a time.
+    """
+    rows = iter_queryset(get_order_values(queryset, with_totals), chunk_size)
+    if with_totals:
+        rows = add_totals(rows)
+    return write_parquet(rows, get_order_columns(with_totals), f)
+
+
+def write_order_items(queryset, f, chunk_size=None):
+    """
+    Write the order items of queryset to the file f in Parquet.
+    """
+    rows = iter_queryset(
+        queryset.values_list(*[name for name, _ in ORDER_ITEM_COLUMNS]), chunk_size
+    )
+    return write_parquet(rows, ORDER_ITEM_COLUMNS, f)
+
+
+def run_parquet_export(export_job, resource):
+    """
+    Export the orders of an export job to its file in Parquet, with their totals
+    if the resource of the job has them (orders.resources.OrderTotalsResource).
+    """
+    with_totals = 'subtotal' in resource.fields
+    pks = json.loads(export_job.queryset)
+    rows = iter_by_pks(
+        get_order_values(Order.objects.all(), with_totals), pks, key=itemgetter(0)
+    )
+    if with_totals:
+        rows = add_totals(rows)
+    filename = '{app}-{model}-{date}.parquet'.format(
+        app=export_job.app_label,
+        model=export_job.model,
+        date=str(timezone.now()),
+    )
+    with spooled_file() as f:
+        write_parquet(rows, get_order_columns(with_totals), f)
+        save_export(f, filename, file_field=export_job.file)
+    ExportJob.objects.filter(pk=export_job.pk).update(job_status='Export complete')
+    logger.info(f'Exported {len(pks)} rows of export job {export_job.pk} to {export_job.file.name}')
+
+
+class Parquet(base_formats.Format):
+    """
+    Export format of django-import-export. The export jobs of orders are written by
+    run_parquet_export() (see orders.celery_patch), other exports from their dataset.
+    """
+    # not a tablib format: the name used by IMPORT_EXPORT_CELERY_EXCLUDED_FORMATS
+    TABLIB_MODULE = 'parquet'
+    CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+    def get_title(self):
+        return 'parquet'
+
+    def get_extension(self):
+        return 'parquet'
+
+    def get_content_type(self):
+        return self.CONTENT_TYPE
+
+    @classmethod
+    def is_available(cls):
+        return pa is not None
+
+    def can_export(self):
+        return True
+
+    def export_data(self, dataset, **kwargs):
+        # the values of a dataset are already formatted by the widgets, kept as text
+        table = pa.table({
+            header: pa.array(
+                [None if value is None else str(value) for value in dataset[header]],
+                type=pa.string()
+            )
+            for header in dataset.headers
+        })
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression='snappy')
+        return sink.getvalue().to_pybytes()
+
+
+def register_format():
+    """
+    Offer Parquet with the other formats of the export jobs and of the admin export,
+    which both use import_export's DEFAULT_FORMATS, when pyarrow is installed.
+    """
+    if Parquet.is_available() and Parquet not in base_formats.DEFAULT_FORMATS:
+        base_formats.DEFAULT_FORMATS.append(Parquet)
@@ -0,0 +1,181 @@
+"""
+Streaming export of orders, for orders.celery_patch, the admin and the export_orders command.
+
+resource.export() builds a tablib Dataset of every row before anything is written.
+Here the objects are read from the database chunk by chunk with iterator(), each one is
+turned into a row and written out right away, so the memory used doesn't depend on the
+number of rows: rows are written to a temporary file that is copied to the storage in
+blocks, or sent to the browser with a StreamingHttpResponse.
+"""
+import csv
+import json
+import logging
+from itertools import islice
+from operator import attrgetter
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from import_export_celery.models import ExportJob
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'jsonl': 'application/jsonl',
+}
+
+
+class Echo:
+    """
+    File-like object returning what is written instead of keeping it,
+    so csv.writer() formats one row at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_rows(resource, objects):
+    """
+    Yield the header and then the exported values of every object, formatted by the
+    fields and widgets of the resource like resource.export() does.
+    """
+    export_fields = resource.get_export_fields()
+    yield resource.get_export_headers()
+    for obj in objects:
+        yield [resource.export_field(field, obj) for field in export_fields]
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    headers = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), default=str) + '\n'
+
+
+def iter_json(rows):
+    """
+    A JSON array of objects like tablib's JSON format, one object per line.
+    """
+    separator = '[\n'
+    for line in iter_jsonl(rows):
+        yield separator + line.rstrip('\n')
+        separator = ',\n'
+    yield '\n]\n' if separator != '[\n' else '[]\n'
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+    'jsonl': iter_jsonl,
+}
+
+
+def iter_queryset(queryset, chunk_size=None):
+    """
+    Iterate the objects of the queryset fetching chunk_size rows at a time,
+    without keeping them in the queryset cache.
+    """
+    return queryset.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+def iter_export(resource, objects, format):
+    """
+    Yield the lines of the export of objects in format (a key of WRITERS).
+    """
+    return WRITERS[format](iter_rows(resource, objects))
+
+
+def spooled_file():
+    """
+    A temporary file kept in memory up to EXPORT_SPOOL_MAX_SIZE bytes and on disk beyond.
+    """
+    return SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+
+
+def save_export(f, name, storage=None, file_field=None):
+    """
+    Save the temporary file f to file_field or to storage under name.
+    Return the name of the saved file.
+    """
+    f.seek(0)
+    # the storage copies the file in blocks of File.DEFAULT_CHUNK_SIZE bytes
+    if file_field is not None:
+        file_field.save(name, File(f))
+        return file_field.name
+    return storage.save(name, File(f))
+
+
+def write_export(lines, name, storage=None, file_field=None):
+    """
+    Write the lines to a temporary file, then save it to file_field or to storage under name.
+    Return the name of the saved file.
+    """
+    with spooled_file() as f:
+        for line in lines:
+            f.write(line.encode('utf-8'))
+        return save_export(f, name, storage, file_field)
+
+
+def iter_by_pks(queryset, pks, chunk_size=None, key=attrgetter('pk')):
+    """
+    Iterate the rows of queryset whose primary keys are pks, in the order of pks,
+    fetching them chunk_size at a time instead of with a single pk__in query, which
+    would have to hold as many parameters as there are rows. key(row) is the primary
+    key of a row of the queryset.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    pks = iter(pks)
+    while chunk := list(islice(pks, chunk_size)):
+        rows = {key(row): row for row in queryset.filter(pk__in=chunk)}
+        yield from (rows[pk] for pk in chunk if pk in rows)
+
+
+def iter_job_objects(export_job, resource, pks):
+    """
+    Iterate the objects of an export job, whose primary keys are pks (the job keeps
+    them as a JSON list, in the order of the admin changelist).
+    """
+    if hasattr(resource, 'get_export_queryset'):
+        queryset = resource.get_export_queryset()
+    else:
+        queryset = export_job.get_content_type().model_class().objects.all()
+    return iter_by_pks(queryset, pks)
+
+
+def count_exported(objects, export_job, total):
+    """
+    Pass the objects through and show the number exported so far in the job status.
+    """
+    for number, obj in enumerate(objects, 1):
+        if number % settings.EXPORT_CHUNK_SIZE == 0:
+            # update() doesn't send post_save, which starts the export job
+            ExportJob.objects.filter(pk=export_job.pk).update(
+                job_status=f'Exporting row {number}/{total}'
+            )
+        yield obj
+
+
+def run_streaming_export(export_job, resource, format):
+    """
+    Export the objects of an export job in format ('csv' or 'json') to its file.
+    """
+    pks = json.loads(export_job.queryset)
+    objects = count_exported(iter_job_objects(export_job, resource, pks), export_job, len(pks))
+    filename = '{app}-{model}-{date}.{extension}'.format(
+        app=export_job.app_label,
+        model=export_job.model,
+        date=str(timezone.now()),
+        extension=format,
+    )
+    write_export(iter_export(resource, objects, format), filename, file_field=export_job.file)
+    ExportJob.objects.filter(pk=export_job.pk).update(job_status='Export complete')
+    logger.info(f'Exported {len(pks)} rows of export job {export_job.pk} to {export_job.file.name}')
@@ -0,0 +1,414 @@
+"""
+Streaming import of CSV files for orders.celery_patch.
+
+The file is read record by record instead of all at once, and the records are imported
+in chunks of IMPORT_CHUNK_SIZE rows, each in its own transaction. After each chunk the
+byte offset of the next record is saved in an ImportJobProgress row in the same
+transaction, so an import interrupted by a worker crash resumes after the last
+committed chunk instead of starting over. Big files are split into byte ranges
+imported in parallel by several workers.
+
+The tasks are acknowledged late, so the broker can deliver one again while a worker is
+still importing its range (RabbitMQ does after consumer_timeout). Each run claims the
+range in its ImportJobProgress and checks the claim in the transaction of every chunk:
+two runs never import the same rows.
+"""
+import csv
+import io
+import logging
+import uuid
+from datetime import timedelta
+
+import tablib
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from import_export_celery.models import ImportJob
+
+from .models import ImportJobProgress
+
+
+logger = logging.getLogger(__name__)
+
+# Error messages kept per import, the others are only counted
+MAX_ERRORS = 100
+
+
+class ImportRangeBusy(Exception):
+    """
+    The byte range is being imported by another run.
+    """
+
+
+def read_record(f):
+    """
+    Read one CSV record from a file opened in binary mode. A quoted field can contain
+    newlines, so lines are added until the quotes are balanced (an escaped quote is
+    written twice and doesn't change the balance).
+    """
+    record = f.readline()
+    while record.count(b'"') % 2:
+        line = f.readline()
+        if not line:
+            break
+        record += line
+    return record
+
+
+def read_header(f):
+    """
+    Return the header record and the byte offset of the first data record.
+    """
+    f.seek(0)
+    header = read_record(f)
+    return header, f.tell()
+
+
+def iter_records(f, start, end):
+    """
+    Yield the records between the byte offsets start and end, with the offset
+    following each of them. Blank lines are skipped.
+    """
+    f.seek(start)
+    while f.tell() < end:
+        record = read_record(f)
+        if not record:
+            break
+        if record.strip():
+            yield record, f.tell()
+
+
+def load_dataset(header, records):
+    dataset = tablib.Dataset()
+    # the header may start with the UTF-8 byte order mark written by Excel
+    text = header.decode('utf-8-sig') + b''.join(records).decode('utf-8')
+    dataset.load(text, format='csv')
+    return dataset
+
+
+def get_error_messages(result, first_row):
+    """
+    The messages of the row errors and validation errors of an import result, with the
+    row numbers counted from the start of the file instead of the start of the chunk,
+    and of the errors of the whole chunk, like a failed bulk_create() or bulk_update().
+    """
+    messages = [
+        f'Rows from {first_row + 1}: {error.error}' for error in result.base_errors
+    ]
+    for number, errors in result.row_errors():
+        for error in errors:
+            messages.append(f'Row {first_row + number}: {error.error}')
+    for row in result.invalid_rows:
+        messages.append(f'Row {first_row + row.number}: {row.error_dict}')
+    return messages
+
+
+def get_progress(import_job, dry_run, start, end, first_row):
+    """
+    Return the progress of the import of the byte range start-end, to resume it.
+    first_row is the number of rows of the file before the range.
+    """
+    progress, created = ImportJobProgress.objects.get_or_create(
+        import_job=import_job, dry_run=dry_run, shard_start=start,
+        defaults={'shard_end': end, 'offset': start, 'first_row': first_row}
+    )
+    if not created and progress.shard_end != end:
+        # the file was split differently, the range is imported again from its start
+        progress.shard_end = end
+        progress.first_row = first_row
+        progress.offset = start
+        progress.rows_imported = 0
+        progress.totals = {}
+        progress.errors = []
+        progress.finished = False
+        progress.save()
+    elif not created and not progress.finished:
+        logger.info(
+            'Resuming import job %s at byte %s, %s rows already imported',
+            import_job.pk, progress.offset, progress.rows_imported
+        )
+    return progress
+
+
+def prepare_progress(import_job, dry_run, ranges):
+    """
+    Create or fetch the progress of every byte range of the import, given as
+    (start, end, first_row). A previous import that was interrupted is resumed,
+    one that had finished is started over.
+    """
+    previous = ImportJobProgress.objects.filter(import_job=import_job, dry_run=dry_run)
+    if not previous.filter(finished=False).exists():
+        previous.delete()
+    else:
+        previous.exclude(shard_start__in=[start for start, _, _ in ranges]).delete()
+    return [get_progress(import_job, dry_run, *bounds) for bounds in ranges]
+
+
+def report_progress(import_job, dry_run):
+    """
+    Show the rows imported and the percentage of the file done in the job status.
+    """
+    totals = ImportJobProgress.objects.filter(
+        import_job=import_job, dry_run=dry_run
+    ).aggregate(
+        rows=Sum('rows_imported'),
+        done=Sum(F('offset') - F('shard_start')),
+        size=Sum(F('shard_end') - F('shard_start'))
+    )
+    percent = totals['done'] * 100 // totals['size'] if totals['size'] else 100
+    # update() doesn't send post_save, which would start the import again
+    ImportJob.objects.filter(pk=import_job.pk).update(
+        job_status=get_status(dry_run, f"Importing: {totals['rows']} rows ({percent}%)")
+    )
+
+
+def claim_progress(progress):
+    """
+    Claim the byte range of progress for this run and reload it. A range can be claimed
+    if it's unclaimed, or if the run holding it hasn't saved a chunk for
+    IMPORT_CLAIM_TIMEOUT seconds. Raise ImportRangeBusy if another run holds it.
+    A finished range isn't claimed.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    # a single UPDATE: of two runs claiming at the same time only one matches
+    claimed = ImportJobProgress.objects.filter(pk=progress.pk, finished=False).filter(
+        Q(claimed_by='') | Q(updated__lt=now - timedelta(seconds=settings.IMPORT_CLAIM_TIMEOUT))
+    ).update(claimed_by=token, updated=now)
+    progress.refresh_from_db()
+    if not claimed and not progress.finished:
+        raise ImportRangeBusy(f'{progress} is being imported by another run')
+    return progress
+
+
+def lock_claim(progress):
+    """
+    Lock the progress row until the end of the transaction, so the range can't be taken
+    over meanwhile, and raise ImportRangeBusy if another run has taken it over already.
+    """
+    locked = ImportJobProgress.objects.select_for_update().filter(
+        pk=progress.pk, claimed_by=progress.claimed_by
+    )
+    if not locked.exists():
+        raise ImportRangeBusy(f'{progress} was taken over by another run')
+
+
+def import_chunk(resource, header, records, progress, offset):
+    """
+    Import a chunk of records and save the progress in the same transaction:
+    either both are committed or neither is.
+    import_data() rolls the whole chunk back when it has errors (validation errors
+    only skip their rows): then none of its rows is counted as imported, they are all
+    counted as errors.
+    """
+    dataset = load_dataset(header, records)
+    with transaction.atomic():
+        lock_claim(progress)
+        result = resource.import_data(
+            dataset, dry_run=progress.dry_run, use_transactions=True
+        )
+        first_row = progress.first_row + progress.rows_imported
+        messages = get_error_messages(result, first_row)
+        if result.has_errors():
+            progress.totals['error'] = progress.totals.get('error', 0) + len(dataset)
+            messages.append(
+                f'Rows {first_row + 1}-{first_row + len(dataset)}: not imported, '
+                f'the chunk was rolled back'
+            )
+        else:
+            for key, count in result.totals.items():
+                progress.totals[key] = progress.totals.get(key, 0) + count
+        if len(progress.errors) < MAX_ERRORS:
+            progress.errors.extend(messages[:MAX_ERRORS - len(progress.errors)])
+        progress.rows_imported += len(dataset)
+        progress.offset = offset
+        # also the heartbeat of the claim (updated)
+        progress.save()
+
+
+def import_range(import_job, resource, progress, chunk_size=None, on_chunk=None):
+    """
+    Claim the byte range of progress and import its records, from the offset where the
+    previous run stopped, chunk by chunk. on_chunk(progress) is called after each chunk.
+    Raise ImportRangeBusy if another run is importing the range.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    claim_progress(progress)
+    if progress.finished:
+        return progress
+    try:
+        with import_job.file.open('rb') as f:
+            header, _ = read_header(f)
+            records = []
+            offset = progress.offset
+            for record, offset in iter_records(f, progress.offset, progress.shard_end):
+                records.append(record)
+                if len(records) == chunk_size:
+                    import_chunk(resource, header, records, progress, offset)
+                    records = []
+                    if on_chunk:
+                        on_chunk(progress)
+            if records:
+                import_chunk(resource, header, records, progress, offset)
+                if on_chunk:
+                    on_chunk(progress)
+    except Exception:
+        # release the claim so the import can be run again right away, unless
+        # another run has taken it over
+        ImportJobProgress.objects.filter(
+            pk=progress.pk, claimed_by=progress.claimed_by
+        ).update(claimed_by='')
+        raise
+    with transaction.atomic():
+        lock_claim(progress)
+        progress.finished = True
+        progress.claimed_by = ''
+        progress.save()
+    return progress
+
+
+def get_status(dry_run, status):
+    return f'[Dry run] {status}' if dry_run else status
+
+
+def finish_import(import_job, progresses, dry_run):
+    """
+    Merge the totals and errors of the imported ranges into the import job.
+    """
+    totals = {}
+    errors = []
+    for progress in progresses:
+        for key, count in progress.totals.items():
+            totals[key] = totals.get(key, 0) + count
+        errors.extend(progress.errors)
+    if errors:
+        import_job.errors = '; '.join(errors[:5])    # Limit to first five errors
+        import_job.job_status = get_status(dry_run, 'Import error')
+        logger.error(f'Import errors: {import_job.errors}')
+    else:
+        import_job.errors = ''
+        import_job.job_status = get_status(dry_run, 'Import finished')
+    summary_parts = []
+    if totals.get('new', 0) > 0:
+        summary_parts.append(f"Created: {totals['new']}")
+    if totals.get('update', 0) > 0:
+        summary_parts.append(f"Updated: {totals['update']}")
+    if totals.get('skip', 0) > 0:
+        summary_parts.append(f"Skipped: {totals['skip']}")
+    if totals.get('error', 0) > 0:
+        summary_parts.append(f"Failed: {totals['error']}")
+    import_job.change_summary = '; '.join(summary_parts) if summary_parts else 'No changes'
+    import_job.imported = None if dry_run else timezone.now()
+    import_job.save()
+    logger.info(f'Import finished: {import_job.change_summary}')
+    return totals
+
+
+def find_shard_boundaries(f, start, end, shards):
+    """
+    Split the byte range start-end into about shards ranges of the same size, each
+    beginning at a record boundary, and return them as (start, end, first_row).
+    The records are scanned from the start: a newline found by seeking to an arbitrary
+    offset could be inside a quoted field.
+    """
+    step = (end - start) / shards
+    boundaries = [(start, 0)]
+    for rows, (_, offset) in enumerate(iter_records(f, start, end), 1):
+        if offset >= start + step * len(boundaries) and offset < end:
+            boundaries.append((offset, rows))
+            if len(boundaries) == shards:
+                break
+    return [
+        (range_start, range_end, first_row)
+        for (range_start, first_row), (range_end, _) in zip(boundaries, boundaries[1:] + [(end, None)])
+    ]
+
+
+def parse_record(record, encoding='utf-8'):
+    return next(csv.reader(io.StringIO(record.decode(encoding))), [])
+
+
+def ranges_share_ids(f, header, ranges, resource):
+    """
+    Whether rows with the same import id (the email of an order) are in two of the
+    byte ranges. Such rows must be imported one after the other by the same task, the
+    later ones updating what the first one created: imported in parallel, each range
+    would create its own. The ids of the whole file are kept in memory while checking.
+    """
+    names = parse_record(header, 'utf-8-sig')
+    columns = [resource.fields[name].column_name for name in resource.get_import_id_fields()]
+    if not set(columns) <= set(names):
+        # without the ids every row is new, whatever the range
+        return False
+    indexes = [names.index(column) for column in columns]
+    ranges_of_ids = {}
+    for number, (start, end, _) in enumerate(ranges):
+        for record, _ in iter_records(f, start, end):
+            values = parse_record(record)
+            ids = tuple(values[index] if index < len(values) else '' for index in indexes)
+            if ranges_of_ids.setdefault(ids, number) != number:
+                return True
+    return False
+
+
+def run_streaming_import(import_job, resource, dry_run):
+    """
+    Import a CSV file chunk by chunk, resuming where a previous run stopped.
+    Files of at least IMPORT_SHARD_MIN_BYTES are split into IMPORT_SHARDS byte ranges
+    imported in parallel by a Celery chord, see run_sharded_import().
+    A file with rows of the same import id in different ranges isn't split.
+    The progress is shown in the job status of the import job after each chunk.
+    """
+    size = import_job.file.size
+    with import_job.file.open('rb') as f:
+        header, data_start = read_header(f)
+        ranges = [(data_start, size, 0)]
+        if settings.IMPORT_SHARDS > 1 and size >= settings.IMPORT_SHARD_MIN_BYTES:
+            ranges = find_shard_boundaries(f, data_start, size, settings.IMPORT_SHARDS)
+            if len(ranges) > 1 and ranges_share_ids(f, header, ranges, resource):
+                logger.info(
+                    'Import job %s has rows of the same id in different ranges, '
+                    'imported in a single range', import_job.pk
+                )
+                ranges = [(data_start, size, 0)]
+    progresses = prepare_progress(import_job, dry_run, ranges)
+    if len(progresses) > 1:
+        return run_sharded_import(import_job, dry_run, progresses)
+
+    progress = progresses[0]
+    import_range(
+        import_job, resource, progress,
+        on_chunk=lambda progress: report_progress(import_job, dry_run)
+    )
+    totals = finish_import(import_job, [progress], dry_run)
+    return {
+        'success': True,
+        'has_errors': bool(progress.errors),
+        'totals': totals,
+        'row_count': progress.rows_imported,
+        'dry_run': dry_run
+    }
+
+
+def run_sharded_import(import_job, dry_run, progresses):
+    """
+    Import every byte range in its own task, on as many workers as there are
+    available, and merge their totals and errors into the import job when all are done.
+    """
+    # the tasks module imports this one
+    from celery import chord
+    from .tasks import finish_sharded_import, import_shard
+
+    ImportJob.objects.filter(pk=import_job.pk).update(
+        job_status=get_status(dry_run, f'Importing in {len(progresses)} shards')
+    )
+    chord(
+        import_shard.s(import_job.pk, dry_run, progress.shard_start, progress.shard_end)
+        for progress in progresses
+    )(finish_sharded_import.s(import_job.pk, dry_run))
+    return {
+        'success': True,
+        'shards': len(progresses),
+        'dry_run': dry_run
+    }
@@ -0,0 +1,91 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orders.checkout import create_order
+from orders.models import Order, OrderItem
+from shop.models import Category, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_order_one_by_one(order, items):
+    """
+    The previous order_create(): the order is saved and then one INSERT is sent
+    per cart line, each in its own transaction under autocommit. Kept here to compare against.
+    """
+    order.save()
+    for item in items:
+        OrderItem.objects.create(
+            order=order,
+            product=item['product'],
+            price=item['price'],
+            quantity=item['quantity']
+        )
+    return order
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the time and queries it takes to write an order with its items '
+        'for carts of different sizes. Everything is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines', type=int, nargs='+', default=[1, 20, 200],
+            help='Number of cart lines of each benchmarked checkout.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='How many orders are written for each cart size.'
+        )
+
+    def handle(self, *args, **options):
+        # everything runs inside one transaction so it can be rolled back, which also
+        # spares the one-by-one inserts the commit each of them pays under autocommit:
+        # the real difference in production is larger than the one measured here.
+        try:
+            with transaction.atomic():
+                products = self.create_products(max(options['lines']))
+                self.stdout.write(
+                    f'{"lines":>6} {"method":<14} {"queries":>8} {"ms/order":>10}'
+                )
+                for lines in options['lines']:
+                    items = [
+                        {'product': product, 'price': product.price, 'quantity': 2}
+                        for product in products[:lines]
+                    ]
+                    self.measure(lines, 'one by one', create_order_one_by_one,
+                                 items, options['repeat'])
+                    self.measure(lines, 'bulk', create_order, items, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_products(self, count):
+        category = Category.objects.create(name='Benchmark', slug='benchmark-checkout')
+        return Product.objects.bulk_create([
+            Product(category=category, price=Decimal('9.99'))
+            for _ in range(count)
+        ])
+
+    def new_order(self):
+        return Order(
+            first_name='Bench', last_name='Mark', email='bench@example.com',
+            address='Street 1', postal_code='00000', city='City'
+        )
+
+    def measure(self, lines, label, create, items, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            create(self.new_order(), items)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            create(self.new_order(), items)
+        elapsed = (time.perf_counter() - start) / repeat
+        self.stdout.write(f'{lines:>6} {label:<14} {len(queries):>8} {elapsed * 1000:>10.2f}')
@@ -0,0 +1,128 @@
+import csv
+import tempfile
+import time
+from decimal import Decimal
+from itertools import chain
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orders import columnar
+from orders.exporting import iter_csv, iter_export, iter_queryset
+from orders.models import Order, OrderItem
+from orders.resources import OrderTotalsResource
+from shop.models import Category, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+def write_orders_csv(path):
+    """
+    The CSV export of the orders with their totals, through OrderTotalsResource.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.writelines(iter_export(
+            OrderTotalsResource(), iter_queryset(Order.objects.with_totals().order_by('pk')), 'csv'
+        ))
+
+
+def write_order_items_csv(path):
+    """
+    The order items in CSV, from the same values_list() as the Parquet export.
+    """
+    names = [name for name, _ in columnar.ORDER_ITEM_COLUMNS]
+    rows = iter_queryset(OrderItem.objects.order_by('order_id', 'pk').values_list(*names))
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.writelines(iter_csv(chain([names], rows)))
+
+
+def write_orders_parquet(path):
+    with open(path, 'wb') as f:
+        columnar.write_orders(Order.objects.order_by('pk'), f, with_totals=True)
+
+
+def write_order_items_parquet(path):
+    with open(path, 'wb') as f:
+        columnar.write_order_items(OrderItem.objects.order_by('order_id', 'pk'), f)
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return sum(1 for _ in csv.reader(f)) - 1
+
+
+def read_parquet(path):
+    return columnar.pq.read_table(path).num_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the CSV and Parquet exports of orders (with their totals) and order items: '
+        'export time, file size and the time to read the file back. Synthetic orders are '
+        'created for the benchmark and rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not columnar.Parquet.is_available():
+            raise CommandError('The Parquet format needs the pyarrow package (pip install pyarrow).')
+        try:
+            with transaction.atomic():
+                self.create_orders(options['orders'], options['items_per_order'])
+                self.stdout.write(
+                    f'{"export":<12} {"format":<8} {"rows":>8} {"seconds":>8} {"MB":>8} '
+                    f'{"read s":>7}'
+                )
+                with tempfile.TemporaryDirectory() as directory:
+                    directory = Path(directory)
+                    self.run('orders', 'csv', write_orders_csv, read_csv, directory)
+                    self.run('orders', 'parquet', write_orders_parquet, read_parquet, directory)
+                    self.run('order items', 'csv', write_order_items_csv, read_csv, directory)
+                    self.run(
+                        'order items', 'parquet', write_order_items_parquet, read_parquet, directory
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_orders(self, count, items_per_order):
+        self.stdout.write(f'Creating {count} orders with {items_per_order} items each...')
+        category = Category.objects.create(name='Benchmark', slug='benchmark-export')
+        products = Product.objects.bulk_create([
+            Product(category=category, price=Decimal('9.99')) for _ in range(10)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(
+                first_name='Bench', last_name=f'Mark {i}', email=f'bench.mark{i}@example.com',
+                address=f'{i % 900 + 100} Everest Ln', postal_code='44600', city='Kathmandu',
+                paid=i % 2 == 0, discount=10 if i % 4 == 0 else 0
+            )
+            for i in range(count)
+        ], batch_size=2000)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=products[(order.pk + j) % len(products)],
+                price=Decimal('9.99'), quantity=j + 1
+            )
+            for order in orders
+            for j in range(items_per_order)
+        ], batch_size=2000)
+
+    def run(self, label, format, write, read, directory):
+        path = directory / f'{label.replace(" ", "-")}.{format}'
+        start = time.perf_counter()
+        write(path)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        rows = read(path)
+        read_elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{label:<12} {format:<8} {rows:>8} {elapsed:>8.2f} '
+            f'{path.stat().st_size / 1024 / 1024:>8.1f} {read_elapsed:>7.2f}'
+        )
@@ -0,0 +1,125 @@
+import csv
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from import_export.instance_loaders import ModelInstanceLoader
+
+from orders.importing import iter_records, load_dataset, read_header
+from orders.resources import OrderResource
+
+
+SAMPLE = Path(__file__).resolve().parents[2] / 'order_unique_1500_sample.csv'
+
+HEADER = [
+    'first_name', 'last_name', 'email', 'address', 'postal_code',
+    'city', 'paid', 'created', 'updated', 'stripe_id'
+]
+
+
+class PerRowOrderResource(OrderResource):
+    """
+    The previous import configuration: one query per row to look the order up, one
+    INSERT or UPDATE per row and the diff of every row. Kept here to compare against.
+    """
+    class Meta(OrderResource.Meta):
+        instance_loader_class = ModelInstanceLoader
+        use_bulk = False
+        skip_diff = False
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def write_synthetic_file(f, rows):
+    writer = csv.writer(f)
+    writer.writerow(HEADER)
+    for i in range(rows):
+        paid = i % 2 == 0
+        writer.writerow([
+            'Bench', f'Mark {i}', f'bench.mark{i:07d}@example.com', f'{i % 900 + 100} Everest Ln',
+            '44600', 'Kathmandu', paid, '2025-08-01 10:00:00', '2025-08-01 10:00:00',
+            f'pi_bench_{i:07d}' if paid else ''
+        ])
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the import speed in rows/s of the per-row and bulk OrderResource on the '
+        '1,500-row sample and on a synthetic file. Everything is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000, help='Rows of the synthetic file (0 to skip it).'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--per-row-max-rows', type=int, default=20000,
+            help='The slow per-row import is only run on files up to this many rows.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"file":<12} {"resource":<10} {"rows":>8} {"seconds":>9} {"rows/s":>9} {"queries":>9}'
+        )
+        self.benchmark_file('sample', SAMPLE, options)
+        if options['rows']:
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as f:
+                self.stdout.write(f'Writing {options["rows"]} rows to {f.name}...')
+                write_synthetic_file(f, options['rows'])
+                f.flush()
+                self.benchmark_file('synthetic', Path(f.name), options)
+
+    def benchmark_file(self, label, path, options):
+        with open(path, 'rb') as f:
+            rows = sum(1 for _ in iter_records(f, read_header(f)[1], path.stat().st_size))
+        resources = [('bulk', OrderResource)]
+        if rows <= options['per_row_max_rows']:
+            resources.insert(0, ('per row', PerRowOrderResource))
+        for name, resource_class in resources:
+            counter = QueryCounter()
+            try:
+                with transaction.atomic(), connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    self.import_file(path, resource_class(), options['chunk_size'])
+                    elapsed = time.perf_counter() - start
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(
+                f'{label:<12} {name:<10} {rows:>8} {elapsed:>9.2f} {rows / elapsed:>9.0f} '
+                f'{counter.queries:>9}'
+            )
+
+    def import_file(self, path, resource, chunk_size):
+        """
+        Import the file chunk by chunk like orders.importing, without an ImportJob.
+        """
+        with open(path, 'rb') as f:
+            header, start = read_header(f)
+            records = []
+            for record, _ in iter_records(f, start, path.stat().st_size):
+                records.append(record)
+                if len(records) == chunk_size:
+                    self.import_chunk(resource, header, records)
+                    records = []
+            if records:
+                self.import_chunk(resource, header, records)
+
+    def import_chunk(self, resource, header, records):
+        result = resource.import_data(load_dataset(header, records), use_transactions=True)
+        if result.has_errors() or result.has_validation_errors():
+            raise RuntimeError('The benchmark file has errors')
@@ -0,0 +1,86 @@
+import time
+from resource import RUSAGE_SELF, getrusage
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders import columnar
+from orders.exporting import iter_export, iter_queryset, save_export, spooled_file, write_export
+from orders.models import Order, OrderItem
+from orders.resources import OrderResource, OrderTotalsResource
+
+
+class Command(BaseCommand):
+    help = (
+        'Export the orders to the default storage in CSV, JSON Lines or Parquet, reading them '
+        'from the database a chunk at a time: the memory used is the same whatever the number '
+        'of orders.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], default='csv')
+        parser.add_argument(
+            '--totals', action='store_true',
+            help='Add the subtotal, discount and total of the items of every order.'
+        )
+        parser.add_argument(
+            '--items', action='store_true',
+            help='Export the order items instead of the orders (Parquet only).'
+        )
+        parser.add_argument('--paid', action='store_true', help='Only the paid orders.')
+        parser.add_argument('--chunk-size', type=int, help='Default: EXPORT_CHUNK_SIZE.')
+        parser.add_argument('--output', help='Name of the file in the storage.')
+
+    def handle(self, *args, **options):
+        format = options['format']
+        if format == 'parquet' and not columnar.Parquet.is_available():
+            raise CommandError('The Parquet format needs the pyarrow package (pip install pyarrow).')
+        if options['items'] and format != 'parquet':
+            raise CommandError('--items is only available with --format parquet.')
+        model = 'order-items' if options['items'] else 'orders'
+        name = options['output'] or f'exports/{model}-{timezone.now():%Y%m%d-%H%M%S}.{format}'
+
+        start = time.perf_counter()
+        if format == 'parquet':
+            name = self.export_parquet(name, options)
+        else:
+            name = self.export_text(name, options)
+        elapsed = time.perf_counter() - start
+        # ru_maxrss is in kilobytes on Linux
+        peak = getrusage(RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f'Exported to {name} ({default_storage.size(name)} bytes) in {elapsed:.2f}s, '
+            f'peak memory {peak:.0f} MB'
+        )
+
+    def get_orders(self, options):
+        queryset = Order.objects.order_by('pk')
+        if options['paid']:
+            queryset = queryset.filter(paid=True)
+        return queryset
+
+    def export_text(self, name, options):
+        queryset = self.get_orders(options)
+        if options['totals']:
+            resource = OrderTotalsResource()
+            queryset = queryset.with_totals()
+        else:
+            resource = OrderResource()
+        return write_export(
+            iter_export(resource, iter_queryset(queryset, options['chunk_size']), options['format']),
+            name, storage=default_storage
+        )
+
+    def export_parquet(self, name, options):
+        with spooled_file() as f:
+            if options['items']:
+                queryset = OrderItem.objects.order_by('order_id', 'pk')
+                if options['paid']:
+                    queryset = queryset.filter(order__paid=True)
+                columnar.write_order_items(queryset, f, options['chunk_size'])
+            else:
+                columnar.write_orders(
+                    self.get_orders(options), f, options['totals'], options['chunk_size']
+                )
+            return save_export(f, name, storage=default_storage)
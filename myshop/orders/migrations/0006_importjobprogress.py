@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('import_export_celery', '0011_alter_exportjob_id_alter_importjob_id'),
+        ('orders', '0005_alter_order_address_alter_order_city_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJobProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dry_run', models.BooleanField(default=False)),
+                ('shard_start', models.PositiveBigIntegerField()),
+                ('shard_end', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField()),
+                ('rows_imported', models.PositiveIntegerField(default=0)),
+                ('totals', models.JSONField(default=dict)),
+                ('errors', models.JSONField(default=list)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('import_job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='import_export_celery.importjob')),
+            ],
+            options={
+                'ordering': ['shard_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importjobprogress',
+            constraint=models.UniqueConstraint(fields=('import_job', 'dry_run', 'shard_start'), name='unique_import_range'),
+        ),
+    ]
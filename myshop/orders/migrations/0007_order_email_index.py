@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0001_initial'),
+        ('orders', '0006_importjobprogress'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email'], name='orders_orde_email_88c705_idx'),
+        ),
+    ]
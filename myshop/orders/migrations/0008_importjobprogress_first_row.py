@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_email_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobprogress',
+            name='first_row',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_importjobprogress_first_row'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjobprogress',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -1,11 +1,31 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from django.core.validators import MaxValueValidator, MinValueValidator
 from coupons.models import Coupon
 from django.utils.translation import gettext_lazy as _
 
 
+# The sum of price * quantity of the items of an order, computed by the database.
+# Orders without items get 0 instead of NULL.
+ITEMS_SUBTOTAL = Coalesce(
+    Sum(F('items__price') * F('items__quantity')),
+    Value(0),
+    output_field=DecimalField(max_digits=12, decimal_places=2)
+)
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate every order with the subtotal of its items, computed in the same
+        query as the orders, so get_total_cost() and friends don't touch the items.
+        """
+        return self.annotate(subtotal=ITEMS_SUBTOTAL)
+
+
 class Order(models.Model):
     first_name = models.CharField(_('first name'), max_length=50)
     last_name = models.CharField(_('last name'), max_length=50)
@@ -30,10 +50,14 @@ class Order(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100)]
     )
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created']
         indexes = [
             models.Index(fields=['-created']),
+            # the imports look the orders up by email (see orders.resources)
+            models.Index(fields=['email']),
         ]
 
     def __str__(self):
@@ -42,23 +66,43 @@ class Order(models.Model):
 
     def get_total_cost(self):
         total_cost = self.get_total_cost_before_discount()
-        return total_cost - self.get_discount()
+        # the discount from the same subtotal: without with_totals() or prefetched items,
+        # the total costs one query instead of two
+        return total_cost - self.get_discount(total_cost)
 
 
     def get_total_cost_before_discount(self):
-        return sum(item.get_cost() for item in self.items.all())
-    # the return statement is basically:
-    # "Loop through all items in this order, calculate each item's cost, and
-    # then add them up to get the total price."
-
-
-    def get_discount(self):
-        total_cost = self.get_total_cost_before_discount()
+        # The subtotal comes from the with_totals() annotation when the order was loaded
+        # with it, else from the prefetched items, else from a single aggregate query.
+        # Nothing is kept on the instance: items added later are counted by the next call,
+        # so the orders shown with their totals are loaded with with_totals().
+        if hasattr(self, 'subtotal'):
+            return self.subtotal
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum((item.get_cost() for item in self.items.all()), Decimal(0))
+        return Order.objects.filter(pk=self.pk).aggregate(subtotal=ITEMS_SUBTOTAL)['subtotal']
+
+
+    def get_discount(self, total_cost=None):
+        if total_cost is None:
+            total_cost = self.get_total_cost_before_discount()
         if self.discount:
             return total_cost * (Decimal(self.discount) / Decimal(100))
         return Decimal(0)
 
 
+    @classmethod
+    def export_resource_classes(cls):
+        """
+        The resources offered by the export jobs of django-import-export-celery.
+        """
+        from .resources import OrderResource, OrderTotalsResource
+        return {
+            'orders': ('Orders', OrderResource),
+            'orders_totals': ('Orders with totals', OrderTotalsResource),
+        }
+
+
     def get_stripe_url(self):
         if not self.stripe_id:
             # no payment associated
@@ -87,4 +131,41 @@ class OrderItem(models.Model):
         return f'{self.id}'
 
     def get_cost(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class ImportJobProgress(models.Model):
+    """
+    How far the import of a byte range of the file of an ImportJob has got,
+    saved after each chunk of rows so an interrupted import can resume (see orders.importing).
+    """
+    import_job = models.ForeignKey(
+        'import_export_celery.ImportJob', related_name='progress', on_delete=models.CASCADE
+    )
+    dry_run = models.BooleanField(default=False)
+    # byte offsets of the first record of the range and of the end of the range
+    shard_start = models.PositiveBigIntegerField()
+    shard_end = models.PositiveBigIntegerField()
+    # number of rows of the file before the range, for the row numbers of the errors
+    first_row = models.PositiveIntegerField(default=0)
+    # byte offset of the first record that hasn't been imported yet
+    offset = models.PositiveBigIntegerField()
+    rows_imported = models.PositiveIntegerField(default=0)
+    # import totals ({'new': 10, 'update': 2, ...}) and error messages of the imported chunks
+    totals = models.JSONField(default=dict)
+    errors = models.JSONField(default=list)
+    finished = models.BooleanField(default=False)
+    # the run importing the range, which refreshes updated after every chunk; another
+    # run takes the range over only once updated is IMPORT_CLAIM_TIMEOUT seconds old
+    claimed_by = models.CharField(max_length=32, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['shard_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['import_job', 'dry_run', 'shard_start'], name='unique_import_range'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Import job {self.import_job_id} bytes {self.shard_start}-{self.shard_end}'
@@ -1,14 +1,53 @@
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from import_export import resources, fields
 from import_export.widgets import DateTimeWidget, BooleanWidget
+from import_export.instance_loaders import ModelInstanceLoader
 
 from .models import Order
+from collections import Counter
+from decimal import Decimal
 import logging
-import traceback
 
 
 logger = logging.getLogger(__name__)
 logger.info("OrderResource module loaded!!!!!!!!!!!!!!!!!!!!!!!!")
 
+CENT = Decimal('0.01')
+
+
+class UniqueCachedInstanceLoader(ModelInstanceLoader):
+    """
+    Like CachedInstanceLoader, loads the existing instances of all the rows of the
+    dataset with one query, on the single import id field. That field isn't unique in
+    the database: a row matching several instances is a validation error of the row
+    instead of one of them being picked and overwritten.
+    The instances created by the rows are added with add_instance(), so the next rows
+    with the same value update them instead of creating others.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.id_field = self.resource.fields[self.resource.get_import_id_fields()[0]]
+        self.instances = {}
+        self.counts = Counter()
+        if self.dataset.dict and self.id_field.column_name in self.dataset.dict[0]:
+            ids = {self.id_field.clean(row) for row in self.dataset.dict}
+            queryset = self.get_queryset().filter(**{f'{self.id_field.attribute}__in': ids})
+            for instance in queryset:
+                value = self.id_field.get_value(instance)
+                self.instances[value] = instance
+                self.counts[value] += 1
+
+    def get_instance(self, row):
+        value = self.id_field.clean(row)
+        if self.counts[value] > 1:
+            message = f'{self.counts[value]} existing rows match {value}, not updated.'
+            raise ValidationError({self.id_field.attribute: message})
+        return self.instances.get(value)
+
+    def add_instance(self, row, instance):
+        self.instances[self.id_field.clean(row)] = instance
+
 
 class OrderResource(resources.ModelResource):
     # Define datetime fields with proper widget
@@ -29,56 +68,90 @@ class OrderResource(resources.ModelResource):
                   'city', 'paid', 'created', 'updated', 'stripe_id')
         export_order = ('id', 'first_name', 'last_name', 'email', 'address', 'postal_code',
                         'city', 'paid', 'created', 'updated', 'stripe_id')
-        import_id_fields = ('email',)   # Optional unique identifier
-
-
-    def before_import_row(self, row, row_number=None, **kwargs):
-        try:
-            logger.info(f"Processing row {row_number}: {row.get('email', 'N/A')}")
-            # Alternatively, print directly for immediate output
-            print(f"Processing row {row_number}: {row.get('email', 'N/A')}")
-            return super().before_import_row(row, **kwargs)
-        except Exception as e:
-            error_msg = f"Error in before_import_row at row {row_number}: {type(e).__name__}: {e}"
-            logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            print(error_msg)
-            print(f"Row Data: {row}")
-            raise
-
-
-    def import_row(self, row, instance_loader, **kwargs):
+        import_id_fields = ('email',)   # not unique, see UniqueCachedInstanceLoader
+        # The existing orders of all the emails of the dataset (a chunk of the file, see
+        # orders.importing) are loaded with one query before the rows are imported,
+        # instead of one query per row. An email of several existing orders is reported
+        # as an error of its row.
+        instance_loader_class = UniqueCachedInstanceLoader
+        # New and updated orders are written with bulk_create() and bulk_update(),
+        # batch_size at a time. Rows with the same email update the same order: a later
+        # row changes the order an earlier one has queued (see save_instance()).
+        use_bulk = True
+        batch_size = 1000
+        # The before/after values of every row aren't kept for the change report,
+        # the totals are still counted.
+        skip_diff = True
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        # emails of the orders waiting in create_instances and update_instances
+        self.queued_creates = set()
+        self.queued_updates = set()
+
+    def get_or_init_instance(self, instance_loader, row):
+        instance, new = super().get_or_init_instance(instance_loader, row)
+        if new:
+            instance_loader.add_instance(row, instance)
+        return instance, new
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        email = self.fields['email'].clean(row)
+        if self._meta.use_bulk and (email in self.queued_creates or email in self.queued_updates):
+            # an earlier row has queued this very order, which is written once with
+            # the values of the last row
+            self.before_save_instance(instance, row, **kwargs)
+            self.after_save_instance(instance, row, **kwargs)
+            return
+        super().save_instance(instance, is_create, row, **kwargs)
+        (self.queued_creates if is_create else self.queued_updates).add(email)
+
+    def bulk_create(self, *args, **kwargs):
         try:
-            instance = instance_loader.get_instance(row)
-            # Process each row (optional additional logging)
-            if instance:
-                logger.info(f"Updating order for email: {row.get('email', 'N/A')}")
-            else:
-                logger.info(f"Creating order for email: {row.get('email', 'N/A')}")
-
-            return super().import_row(row, instance_loader, **kwargs)
-        except Exception as e:
-            error_msg = f"Error in import_row: {type(e).__name__}:{e}"
-            logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            print(error_msg)
-            print(f"Row Data: {row}")
-            raise
-
-
-    def after_import_row(self, row, row_result, row_number=None, **kwargs):
+            super().bulk_create(*args, **kwargs)
+        finally:
+            # written: a later row with the same email adds the order to the updates
+            self.queued_creates.clear()
+
+    def bulk_update(self, *args, **kwargs):
         try:
-            if row_result.errors:
-                logger.error(f"Row {row_number} errors: {row_result.errors}")
-                print(f"Row {row_number} errors: {row_result.errors}")
-            return super().after_import_row(row, row_result, **kwargs)
-        except Exception as e:
-            error_msg = f"Error in after_import_row at row {row_number}: {type(e).__name__}: {e}"
-            logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            print(error_msg)
-            raise
+            super().bulk_update(*args, **kwargs)
+        finally:
+            self.queued_updates.clear()
+
+    def get_bulk_update_fields(self):
+        # bulk_update() can't write the primary key, the orders are matched by email
+        return [name for name in super().get_bulk_update_fields() if name != 'id']
+
+    def before_save_instance(self, instance, row, **kwargs):
+        # bulk_update() doesn't set the auto_now field like save() does
+        instance.updated = timezone.now()
+
+
+class OrderTotalsResource(OrderResource):
+    """
+    Export only: the orders with the subtotal, discount and total of their items,
+    computed by the database in the query of the orders (see Order.objects.with_totals()).
+    """
+    subtotal = fields.Field(column_name='subtotal', readonly=True)
+    discount_amount = fields.Field(column_name='discount_amount', readonly=True)
+    total = fields.Field(column_name='total', readonly=True)
+
+    class Meta(OrderResource.Meta):
+        fields = OrderResource.Meta.fields + ('subtotal', 'discount_amount', 'total')
+        export_order = OrderResource.Meta.export_order + ('subtotal', 'discount_amount', 'total')
+
+    def get_export_queryset(self):
+        return Order.objects.with_totals()
+
+    def dehydrate_subtotal(self, order):
+        return Decimal(order.get_total_cost_before_discount()).quantize(CENT)
+
+    def dehydrate_discount_amount(self, order):
+        return Decimal(order.get_discount()).quantize(CENT)
 
+    def dehydrate_total(self, order):
+        return Decimal(order.get_total_cost()).quantize(CENT)
 
 
 # Minimal version for testing
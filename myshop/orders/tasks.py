@@ -1,6 +1,11 @@
 from celery import shared_task
+from celery.exceptions import Ignore
+from django.conf import settings
 from django.core.mail import send_mail
-from .models import Order
+from import_export_celery.models import ImportJob
+from .celery_patch import already_succeeded, get_resource
+from .importing import ImportRangeBusy, finish_import, import_range, report_progress
+from .models import ImportJobProgress, Order
 
 import logging
 from importlib import import_module
@@ -88,7 +93,8 @@ def order_created(order_id):
     """
     Task to send an e-mail notification when an order is successfully created.
     """
-    order = Order.objects.get(id=order_id)
+    # with_totals(): the totals don't cost a query each if the e-mail shows them
+    order = Order.objects.with_totals().get(id=order_id)
     subject = f'Order nr. {order.id}'
     message = (
         f'Dear {order.first_name},\n\n'
@@ -101,6 +107,51 @@ def order_created(order_id):
     return mail_sent
 
 
+# acks_late with reject_on_worker_lost: if the worker dies the shard is delivered again
+# and resumes from its last committed chunk (see orders.importing).
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def import_shard(self, import_job_id, dry_run, start, end):
+    """
+    Task to import one byte range of the CSV file of an import job, part of the
+    chord started by orders.importing.run_sharded_import().
+    """
+    if already_succeeded(self):
+        # the chord has counted it already
+        raise Ignore()
+    import_job = ImportJob.objects.get(pk=import_job_id)
+    progress = ImportJobProgress.objects.get(
+        import_job=import_job, dry_run=dry_run, shard_start=start, shard_end=end
+    )
+    try:
+        import_range(
+            import_job, get_resource(import_job), progress,
+            on_chunk=lambda progress: report_progress(import_job, dry_run)
+        )
+    except ImportRangeBusy as e:
+        # delivered again while another worker imports the range: come back when it
+        # has finished it, or when its claim has expired if the worker is gone
+        raise self.retry(exc=e, countdown=settings.IMPORT_CLAIM_TIMEOUT, max_retries=None)
+    return progress.rows_imported
+
+
+@shared_task
+def finish_sharded_import(rows_imported, import_job_id, dry_run):
+    """
+    Task run once every shard of an import job is imported: merge the totals and
+    errors of the shards into the import job.
+    """
+    import_job = ImportJob.objects.get(pk=import_job_id)
+    progresses = ImportJobProgress.objects.filter(import_job=import_job, dry_run=dry_run)
+    totals = finish_import(import_job, progresses, dry_run)
+    return {
+        'success': True,
+        'has_errors': bool(import_job.errors),
+        'totals': totals,
+        'row_count': sum(rows_imported),
+        'dry_run': dry_run
+    }
+
+
 # For test purpose only
 # @shared_task()
 # def test_task():
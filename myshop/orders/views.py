@@ -1,13 +1,16 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import redirect, render, get_object_or_404
-from cart.cart import Cart
+from cart.cart import get_cart
 
 import weasyprint
 from django.contrib.staticfiles import finders
 from django.http import HttpResponse
 from django.template.loader import render_to_string
+from django.utils.translation import gettext as _
 from .forms import OrderCreateForm
-from .models import Order, OrderItem
+from inventory.stock import InsufficientStock
+from .checkout import create_order
+from .models import Order
 from .tasks import order_created
 
 
@@ -17,7 +20,7 @@ def order_create(request):
     # Retrieve the current cart from the session with cart = Cart(request).
     # Instantiates a Cart object that fetches session-stored cart data via request.session. No modification--pure retrieval.
     # Cart class wraps session logic(e.g., self.cart=self.session.get('cart', {})), handling empty cases by defaulting to {}.
-    cart = Cart(request)
+    cart = get_cart(request)
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
@@ -25,18 +28,26 @@ def order_create(request):
             if cart.coupon:
                 order.coupon = cart.coupon
                 order.discount = cart.coupon.discount
-            order.save()
-            for item in cart:   # this calls your __iter__ above from cart.py
-                # each item looks like:
-                # item from the __iter__ method: {'quantity': 5, 'price': Decimal('50.00'),
-                # 'product': <Product: Red Tea>, 'total_price': Decimal('250.00')}
-                OrderItem.objects.create(
-                    order=order,                # the Order instance you just saved
-                    product=item['product'],    # a Product model instance
-                    price=item['price'],        # price at time of order
-                    quantity=item['quantity']   # how many units
+            # the order and all its items are written in one transaction with a single
+            # bulk INSERT for the items, instead of one INSERT per cart line.
+            # each cart item looks like:
+            # {'quantity': 5, 'price': Decimal('50.00'),
+            # 'product': <Product: Red Tea>, 'total_price': Decimal('250.00')}
+            try:
+                create_order(order, cart)
+            except InsufficientStock as e:
+                # nothing was saved, the customer can change the cart and try again
+                form.add_error(
+                    None,
+                    _('Only %(available)s of %(product)s left in stock.') % {
+                        'available': e.available, 'product': e.product.name
+                    }
+                )
+                return render(
+                    request,
+                    'orders/order/create.html',
+                    {'cart': cart, 'form': form}
                 )
-            # item['price'] and item['quantity'] came straight from your session data via the Cart’s __iter__.
 
             # clear the cart
             cart.clear()
@@ -64,7 +75,10 @@ def order_create(request):
 # the user requesting the page are set to True.
 @staff_member_required
 def admin_order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(
+        Order.objects.with_totals().prefetch_related('items__product__translations'),
+        id=order_id
+    )
     return render(
         request, 'admin/orders/order/detail.html', {'order': order}
     )
@@ -76,7 +90,10 @@ def admin_order_detail(request, order_id):
 # Rendering PDF files
 @staff_member_required
 def admin_order_pdf(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(
+        Order.objects.with_totals().prefetch_related('items__product__translations'),
+        id=order_id
+    )
     # Render HTML template
     html = render_to_string('orders/order/pdf.html', {'order': order})
 
@@ -12,7 +12,10 @@ def payment_completed(order_id):
     """
     Task to send an email notification when an order is successfully paid.
     """
-    order = Order.objects.get(id=order_id)
+    # the totals are annotated and the items prefetched for the invoice
+    order = Order.objects.with_totals().prefetch_related(
+        'items__product__translations'
+    ).get(id=order_id)
     # create invoice e-mail
     subject = f'My Shop - Invoice no. {order.id}'
     message = (
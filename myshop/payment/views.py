@@ -5,6 +5,7 @@ from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from orders.models import Order
+from inventory.tasks import release_order_reservations
 
 
 # create the stripe instance
@@ -17,8 +18,10 @@ def payment_process(request):
     # Optimized query: prefetch related items and their products
     # “Get me the order with this ID. While fetching it, also prefetch its related order items
     # and their products in advance. If no such order exists, return a 404 error.”
+    # with_totals() computes the subtotal in the same query as the order.
     order = get_object_or_404(
-        Order.objects.prefetch_related('items__product'), id=order_id
+        Order.objects.with_totals().prefetch_related('items__product__translations'),
+        id=order_id
     )
 
     if request.method == 'POST':
@@ -83,6 +86,10 @@ def payment_completed(request):
 
 
 def payment_canceled(request):
+    # the order won't be paid, its reserved stock goes back on sale
+    order_id = request.session.get('order_id')
+    if order_id:
+        release_order_reservations.delay(order_id)
     return render(request, 'payment/cancelled.html')
 
 
@@ -4,6 +4,7 @@ from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from orders.models import Order
 from .tasks import payment_completed
+from inventory.stock import confirm_order
 from shop.models import Product
 from shop.recommender import Recommender
 
@@ -52,6 +53,8 @@ def stripe_webhook(request):
             # store Stripe payment ID
             order.stripe_id = session.payment_intent
             order.save()
+            # the reserved stock of the order is sold for good
+            confirm_order(order.id)
 
             # save item bought for product recommendations
             # when a new order payment is confirmed; you retrieve the Product objects associated with the order items.
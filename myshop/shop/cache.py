@@ -0,0 +1,32 @@
+import time
+from django.core.cache import cache
+from .recommender import Recommender
+
+
+# The catalog pages are cached per language and category (see the {% cache %} tag in
+# shop/product/list.html). The catalog version is part of their cache key: it changes
+# whenever a product or a category is saved or deleted (see signals.py), so edits show
+# up right away and the old fragments simply expire. The version and the fragments are
+# in the default cache, kept in Redis: a change made by any process (a web worker, a
+# Celery worker) is seen by all of them.
+CATALOG_VERSION_KEY = 'shop:catalog_version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # never set or evicted: start a new version, older fragments can't be used anymore.
+        # add() keeps the version of another process that got there first.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def refresh_catalog():
+    # the cached catalog pages and suggested products show names, slugs, prices and images
+    invalidate_catalog()
+    Recommender().clear_cache()
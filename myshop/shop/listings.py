@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import transaction
+from .models import Product, ProductListing
+
+
+def build_listings(products):
+    """
+    Yield the ProductListing rows of the given products: one per translation.
+    The products must come with their category, translations and category translations
+    prefetched (see get_listing_queryset()), or every row costs a few queries.
+    """
+    for product in products:
+        category = product.category
+        for translation in product.translations.all():
+            language = translation.language_code
+            yield ProductListing(
+                product=product,
+                language_code=language,
+                name=translation.name,
+                slug=translation.slug,
+                description=translation.description,
+                image=product.image.name,
+                renditions=product.renditions,
+                price=product.price,
+                available=product.available,
+                # falls back to another language if the category isn't translated to this one
+                category_name=category.safe_translation_getter(
+                    'name', language_code=language, any_language=True
+                ) or '',
+                category_slug=category.safe_translation_getter(
+                    'slug', language_code=language, any_language=True
+                ) or '',
+                created=product.created,
+            )
+
+
+def get_listing_queryset():
+    return Product.objects.select_related('category').prefetch_related(
+        'translations', 'category__translations'
+    )
+
+
+def sync_product_listings(product_ids):
+    """
+    Replace the ProductListing rows of the given products with fresh ones.
+    """
+    with transaction.atomic():
+        ProductListing.objects.filter(product_id__in=product_ids).delete()
+        ProductListing.objects.bulk_create(
+            build_listings(get_listing_queryset().filter(id__in=product_ids)),
+            batch_size=1000
+        )
+
+
+def rebuild_product_listings(chunk_size=1000, progress=None):
+    """
+    Rebuild the whole ProductListing table, chunk_size products at a time.
+    Return the number of products processed.
+    """
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    with transaction.atomic():
+        ProductListing.objects.all().delete()
+        for i in range(0, len(product_ids), chunk_size):
+            chunk = product_ids[i:i + chunk_size]
+            ProductListing.objects.bulk_create(
+                build_listings(get_listing_queryset().filter(id__in=chunk)),
+                batch_size=1000
+            )
+            if progress:
+                progress(i + len(chunk))
+    return len(product_ids)
+
+
+def use_listings():
+    return settings.SHOP_USE_LISTING_READ_MODEL
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from .listings import use_listings
+from .models import Product, ProductListing
+from .recommender import Recommender
+
+
+ProductTranslation = Product._parler_meta.root_model
+
+
+class LRUCache:
+    """
+    A small in-process cache that forgets the least recently used entries
+    once it holds more than maxsize of them, and every entry after timeout seconds.
+    """
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()    # the cache is shared by the threads of the process
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            value, expires = self.data[key]
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)  # most recently used
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.timeout)
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)   # least recently used
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+# (language, slug) -> product id
+# Looked up in this process first, then in the shared cache (the default cache, in Redis),
+# then in the database. Saving a product translation removes the entries of its old and new
+# slug from the shared cache for every process (see signals.py). The copies kept in the other
+# processes are only used for SHOP_SLUG_LOCAL_TIMEOUT seconds; until then, an outdated one is
+# detected by load_product_detail() (the product it points to doesn't have that slug) and removed.
+slug_cache = LRUCache(settings.SHOP_SLUG_CACHE_SIZE, settings.SHOP_SLUG_LOCAL_TIMEOUT)
+
+
+def get_slug_cache_key(language, slug):
+    return f'shop:slug:{language}:{slug}'
+
+
+def get_product_id(language, slug):
+    """
+    Return the id of the product with the given slug in the given language, or None.
+    """
+    product_id = slug_cache.get((language, slug))
+    if product_id is None:
+        key = get_slug_cache_key(language, slug)
+        product_id = cache.get(key)
+        if product_id is None:
+            product_id = ProductTranslation.objects.filter(
+                language_code=language, slug=slug
+            ).values_list('master_id', flat=True).first()
+            if product_id is None:
+                return None
+            cache.set(key, product_id, settings.SHOP_SLUG_CACHE_TIMEOUT)
+        slug_cache.set((language, slug), product_id)
+    return product_id
+
+
+def forget_slug(language, slug):
+    slug_cache.delete((language, slug))
+    cache.delete(get_slug_cache_key(language, slug))
+
+
+def has_translation(product, language, slug):
+    # the translations are prefetched: no query
+    return any(
+        t.language_code == language and t.slug == slug
+        for t in product.translations.all()
+    )
+
+
+def load_product_detail(language, id, slug):
+    """
+    Return the available product of the detail page and its recommended products,
+    or raise Http404. Runs at most 3 queries for the product (product and category,
+    product translations, category translations) and 2 for the recommended products
+    (none when they are cached), whatever the template reads from them.
+    """
+    if use_listings():
+        # ProductListing has the same attributes as Product for the template
+        try:
+            product = ProductListing.objects.get(
+                product_id=id, language_code=language, slug=slug, available=True
+            )
+        except ProductListing.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+    else:
+        product_id = get_product_id(language, slug)
+        if product_id != id:
+            # unknown slug, or it belonged to another product before: check the database
+            forget_slug(language, slug)
+            product_id = get_product_id(language, slug)
+        if product_id != id:
+            raise Http404('No Product matches the given query.')
+
+        # The product is read by id, without joining the translation table, with everything
+        # the template shows: its category and the translations of both.
+        try:
+            product = Product.objects.select_related('category').prefetch_related(
+                'translations', 'category__translations'
+            ).get(id=id, available=True)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+        if not has_translation(product, language, slug):
+            # outdated entry of another process
+            forget_slug(language, slug)
+            raise Http404('No Product matches the given query.')
+
+    recommended_products = Recommender().suggest_products_for([product], 4)
+    return product, recommended_products
@@ -0,0 +1,150 @@
+import time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from shop.listings import rebuild_product_listings
+from shop.models import Category, Product, ProductListing
+from shop.pagination import KeysetPage
+
+
+LANGUAGES = ['en', 'es']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the join-based catalog queries with the ProductListing read model. '
+        'The products are created in a transaction that is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='How many times each query is run.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_catalog(options['products'], options['categories'])
+                self.stdout.write('Building the listings...')
+                start = time.perf_counter()
+                rebuild_product_listings()
+                self.stdout.write(f'  {time.perf_counter() - start:.1f}s')
+                self.run_benchmarks(options['products'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_catalog(self, product_count, category_count):
+        self.stdout.write(
+            f'Creating {product_count} products x {len(LANGUAGES)} languages...'
+        )
+        CategoryTranslation = Category._parler_meta.root_model
+        ProductTranslation = Product._parler_meta.root_model
+        # the signals would sync the listings of every product, they are rebuilt at once instead
+        receivers = post_save.receivers
+        post_save.receivers = []
+        try:
+            categories = Category.objects.bulk_create(
+                [Category() for _ in range(category_count)]
+            )
+            CategoryTranslation.objects.bulk_create([
+                CategoryTranslation(
+                    master=category, language_code=language,
+                    name=f'Category {i}', slug=f'bench-category-{i}-{language}'
+                )
+                for i, category in enumerate(categories) for language in LANGUAGES
+            ])
+            products = Product.objects.bulk_create(
+                [
+                    Product(category=categories[i % category_count], price=Decimal('9.99'))
+                    for i in range(product_count)
+                ],
+                batch_size=5000
+            )
+            ProductTranslation.objects.bulk_create(
+                [
+                    ProductTranslation(
+                        master=product, language_code=language,
+                        name=f'Product {i}', slug=f'bench-product-{i}-{language}'
+                    )
+                    for i, product in enumerate(products) for language in LANGUAGES
+                ],
+                batch_size=5000
+            )
+        finally:
+            post_save.receivers = receivers
+        self.products = products
+        self.category_slug = 'bench-category-1-es'
+
+    def measure(self, label, repeat, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        elapsed = (time.perf_counter() - start) / repeat
+        self.stdout.write(f'{label:<40} {len(queries):>8} {elapsed * 1000:>10.2f}')
+
+    def run_benchmarks(self, product_count, repeat):
+        language = 'es'
+        # a product in the middle of the catalog
+        product = self.products[product_count // 2]
+        slug = f'bench-product-{product_count // 2}-{language}'
+
+        def join_list():
+            products = Product.objects.filter(
+                available=True, translations__language_code=language
+            ).prefetch_related('translations')
+            [p.name for p in KeysetPage(products)]
+
+        def listing_list():
+            products = ProductListing.objects.filter(language_code=language, available=True)
+            [p.name for p in KeysetPage(products, id_field='product_id')]
+
+        def join_category():
+            category = Category.objects.get(
+                translations__language_code=language, translations__slug=self.category_slug
+            )
+            products = Product.objects.filter(
+                available=True, category=category
+            ).prefetch_related('translations')
+            [p.name for p in KeysetPage(products)]
+
+        def listing_category():
+            products = ProductListing.objects.filter(
+                language_code=language, available=True, category_slug=self.category_slug
+            )
+            [p.name for p in KeysetPage(products, id_field='product_id')]
+
+        def join_detail():
+            p = Product.objects.get(
+                id=product.id, translations__language_code=language,
+                translations__slug=slug, available=True
+            )
+            p.name, p.category.name
+
+        def listing_detail():
+            p = ProductListing.objects.get(
+                product_id=product.id, language_code=language, slug=slug, available=True
+            )
+            p.name, p.category.name
+
+        self.stdout.write(f'{"":<40} {"queries":>8} {"ms":>10}')
+        self.measure('catalog page, join', repeat, join_list)
+        self.measure('catalog page, read model', repeat, listing_list)
+        self.measure('category page, join', repeat, join_category)
+        self.measure('category page, read model', repeat, listing_category)
+        self.measure('detail, join', repeat, join_detail)
+        self.measure('detail, read model', repeat, listing_detail)
@@ -0,0 +1,221 @@
+import time
+from types import SimpleNamespace
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.recommender import Recommender
+
+
+# Product ids used by the benchmark. They are far above any real id so the benchmark
+# never touches the scores of real products, and their keys are deleted at the end.
+FIRST_BENCHMARK_ID = 10 ** 9
+
+
+class RoundTripCounter:
+    """
+    Wrap a Redis client and count the requests it sends to the server.
+    A single command is one round trip, a whole pipeline is one round trip too.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.round_trips = 0
+
+        execute_command = client.execute_command
+        pipeline = client.pipeline
+
+        def counted_execute_command(*args, **kwargs):
+            self.round_trips += 1
+            return execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def counted_execute(*execute_args, **execute_kwargs):
+                self.round_trips += 1
+                return execute(*execute_args, **execute_kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_execute_command
+        client.pipeline = counted_pipeline
+
+    def reset(self):
+        self.round_trips = 0
+
+
+def get_connection(fake):
+    if fake:
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError('--fake needs the fakeredis package (pip install fakeredis).')
+        return fakeredis.FakeRedis()
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB
+    )
+
+
+def products_bought_one_by_one(recommender, products):
+    """
+    The previous products_bought(): one ZINCRBY round trip per pair of products.
+    Kept here to compare against.
+    """
+    product_ids = [p.id for p in products]
+    for product_id in product_ids:
+        for with_id in product_ids:
+            if product_id != with_id:
+                recommender.r.zincrby(
+                    recommender.get_product_key(product_id), 1, with_id
+                )
+
+
+def suggest_product_ids_full_read(recommender, product_ids, max_results):
+    """
+    The previous read path: the whole sorted set is transferred and sliced in Python,
+    with one round trip per command for multiple products.
+    Kept here to compare against.
+    """
+    if len(product_ids) == 1:
+        suggestions = recommender.r.zrange(
+            recommender.get_product_key(product_ids[0]), 0, -1, desc=True
+        )[:max_results]
+    else:
+        temp_key = 'temp_' + ''.join(str(id) for id in product_ids)
+        recommender.r.zunionstore(
+            temp_key, [recommender.get_product_key(id) for id in product_ids]
+        )
+        recommender.r.zrem(temp_key, *product_ids)
+        suggestions = recommender.r.zrange(temp_key, 0, -1, desc=True)[:max_results]
+        recommender.r.delete(temp_key)
+    return [int(id) for id in suggestions]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure Redis round trips and wall time of Recommender.products_bought() '
+        'and of the suggestion reads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[2, 10, 50],
+            help='Number of products per order.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='How many orders to record for each size.'
+        )
+        parser.add_argument(
+            '--fake', action='store_true',
+            help='Use an in-memory fakeredis server instead of the configured Redis.'
+        )
+        parser.add_argument(
+            '--set-size', type=int, default=10000,
+            help='Number of members of each co-purchase set in the read benchmark.'
+        )
+        parser.add_argument(
+            '--max-results', type=int, default=4,
+            help='Number of suggestions read in the read benchmark.'
+        )
+
+    def handle(self, *args, **options):
+        counter = RoundTripCounter(get_connection(options['fake']))
+        recommender = Recommender(connection=counter.client)
+        self.benchmark_writes(counter, recommender, options)
+        self.stdout.write('')
+        self.benchmark_reads(counter, recommender, options)
+
+    def benchmark_writes(self, counter, recommender, options):
+        repeat = options['repeat']
+        self.stdout.write(
+            f'{"products":>8} {"mode":>10} {"round trips":>12} {"ms/order":>10}'
+        )
+        for size in options['sizes']:
+            products = [
+                SimpleNamespace(id=FIRST_BENCHMARK_ID + i) for i in range(size)
+            ]
+            modes = [
+                ('one-by-one', products_bought_one_by_one),
+                ('pipelined', Recommender.products_bought),
+            ]
+            try:
+                for mode, products_bought in modes:
+                    counter.reset()
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        products_bought(recommender, products)
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f'{size:>8} {mode:>10} {counter.round_trips // repeat:>12} '
+                        f'{elapsed / repeat * 1000:>10.2f}'
+                    )
+            finally:
+                # products_bought() also sets the versions of the products
+                counter.client.delete(
+                    *[recommender.get_product_key(p.id) for p in products],
+                    *[recommender.get_version_key(p.id) for p in products]
+                )
+
+    def benchmark_reads(self, counter, recommender, options):
+        repeat = options['repeat']
+        set_size = options['set_size']
+        max_results = options['max_results']
+        # two products, each one with a co-purchase set of set_size other products
+        product_ids = [FIRST_BENCHMARK_ID, FIRST_BENCHMARK_ID + 1]
+        first_member = FIRST_BENCHMARK_ID + 2
+        with counter.client.pipeline(transaction=False) as pipe:
+            for product_id in product_ids:
+                pipe.zadd(
+                    recommender.get_product_key(product_id),
+                    {first_member + i: i for i in range(set_size)}
+                )
+            pipe.execute()
+
+        self.stdout.write(
+            f'{"products":>8} {"mode":>10} {"round trips":>12} {"ms/read":>10}'
+            f'   (sets of {set_size} members, top {max_results})'
+        )
+        # With several products the union of their sets is stored and reused until it
+        # expires: 'top-k cold' passes other versions at every read, so each one stores
+        # a new union, 'top-k warm' reads a union stored before the timing starts.
+        cold_union_keys = [
+            recommender.get_union_key(product_ids, [i]) for i in range(repeat)
+        ]
+        modes = [
+            ('full read', lambda ids, i: suggest_product_ids_full_read(
+                recommender, ids, max_results
+            )),
+            ('top-k', lambda ids, i: recommender.suggest_product_ids(ids, max_results)),
+        ]
+        multi_modes = [
+            modes[0],
+            ('top-k cold', lambda ids, i: recommender.suggest_product_ids(
+                ids, max_results, versions=[i]
+            )),
+            ('top-k warm', modes[1][1]),
+        ]
+        try:
+            recommender.suggest_product_ids(product_ids, max_results)
+            for ids, ids_modes in ((product_ids[:1], modes), (product_ids, multi_modes)):
+                for mode, suggest_product_ids in ids_modes:
+                    counter.reset()
+                    start = time.perf_counter()
+                    for i in range(repeat):
+                        suggest_product_ids(ids, i)
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f'{len(ids):>8} {mode:>10} {counter.round_trips // repeat:>12} '
+                        f'{elapsed / repeat * 1000:>10.2f}'
+                    )
+        finally:
+            counter.client.delete(
+                *[recommender.get_product_key(id) for id in product_ids],
+                recommender.get_union_key(product_ids),
+                *cold_union_keys
+            )
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from shop.cache import refresh_catalog
+from shop.models import Product
+from shop.thumbnails import generate_renditions, needs_renditions, save_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the resized copies of the existing product images, '
+        'in parallel in a pool of processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of processes resizing images (default: number of CPUs).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate the copies of every image, not only the missing ones.'
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'image', 'renditions')
+        todo = [
+            (product.id, product.image.name)
+            for product in products.iterator()
+            if options['force'] or needs_renditions(product)
+        ]
+        self.stdout.write(f'{len(todo)} images to process with {options["workers"]} workers')
+
+        start = time.perf_counter()
+        done = failed = 0
+        # Resizing is CPU bound, so it's done in other processes (threads would share one CPU
+        # because of the GIL). The workers only read and write files, the database is updated
+        # here. django.setup() prepares Django in the workers that don't inherit it (spawn).
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=django.setup
+        ) as pool:
+            futures = {
+                pool.submit(generate_renditions, image_name): (product_id, image_name)
+                for product_id, image_name in todo
+            }
+            for future in as_completed(futures):
+                product_id, image_name = futures[future]
+                try:
+                    renditions = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{image_name}: {type(e).__name__}: {e}')
+                    continue
+                save_renditions(product_id, renditions)
+                done += 1
+
+        if done:
+            refresh_catalog()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {done} images in {elapsed:.1f}s ({failed} failed)'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from shop.listings import rebuild_product_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized ProductListing table from the products and their translations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of products loaded at a time.'
+        )
+
+    def handle(self, *args, **options):
+        def report_progress(products):
+            self.stdout.write(f'{products} products done')
+
+        products = rebuild_product_listings(
+            chunk_size=options['chunk_size'], progress=report_progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the listings of {products} products'))
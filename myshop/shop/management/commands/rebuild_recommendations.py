@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the product recommendations (Redis co-purchase sets) from the paid orders '
+        'in the database. The existing sets are replaced.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of order items read from the database at a time.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of set members sent to Redis per round trip.'
+        )
+        parser.add_argument(
+            '--async', action='store_true', dest='run_async',
+            help='Run the rebuild in a Celery worker instead of this process.'
+        )
+
+    def handle(self, *args, **options):
+        if options['run_async']:
+            from shop.tasks import rebuild_recommendations
+            result = rebuild_recommendations.delay(
+                chunk_size=options['chunk_size'], batch_size=options['batch_size']
+            )
+            self.stdout.write(f'Rebuild started in task {result.id}')
+            return
+
+        def report_progress(orders):
+            self.stdout.write(f'{orders} orders read')
+
+        stats = Recommender().rebuild(
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            progress=report_progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {stats["sets"]} co-purchase sets from {stats["orders"]} orders '
+            f'in {stats["seconds"]:.1f}s ({stats["orders_per_second"]:.0f} orders/s)'
+        ))
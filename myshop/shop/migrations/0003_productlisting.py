@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_translations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('listing_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('language_code', models.CharField(max_length=15)),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('image', models.ImageField(blank=True, upload_to='products/%Y/%m/%d')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('available', models.BooleanField()),
+                ('category_name', models.CharField(max_length=200)),
+                ('category_slug', models.SlugField(max_length=200)),
+                ('created', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listings', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['language_code', 'slug'], name='shop_produc_languag_c807f8_idx'), models.Index(fields=['language_code', 'available', '-created', '-product'], name='shop_produc_languag_b20a9a_idx'), models.Index(fields=['language_code', 'category_slug', 'available', '-created', '-product'], name='shop_produc_languag_5431c7_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productlisting',
+            constraint=models.UniqueConstraint(fields=('product', 'language_code'), name='unique_product_listing'),
+        ),
+    ]
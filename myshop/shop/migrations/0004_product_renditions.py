@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_productlisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -42,6 +42,8 @@ class Product(TranslatableModel):
         upload_to='products/%Y/%m/%d',
         blank=True,
     )
+    # names of the resized copies of image, see thumbnails.py
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     available = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True)
@@ -59,4 +61,81 @@ class Product(TranslatableModel):
         return self.name
 
     def get_absolute_url(self):
-        return reverse('shop:product_detail', args=[self.id, self.slug])
\ No newline at end of file
+        return reverse('shop:product_detail', args=[self.id, self.slug])
+
+
+class ListingCategory:
+    """
+    The category of a ProductListing, with the attributes the templates read from a Category.
+    """
+    def __init__(self, name, slug):
+        self.name = name
+        self.slug = slug
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse(
+            'shop:product_list_by_category', args=[self.slug]
+        )
+
+
+class ProductListing(models.Model):
+    """
+    Denormalized read model of the catalog: one row per product and language with everything
+    the catalog and detail pages show, so they are read from a single table instead of joining
+    the translation tables of Product and Category.
+    Used when settings.SHOP_USE_LISTING_READ_MODEL is True. It's kept in sync by the signals
+    in signals.py and can be rebuilt with the rebuild_product_listings command.
+    """
+    # The primary key isn't named 'id', so 'id' can return the id of the product
+    # like Product.id does (templates build the cart and detail URLs with it).
+    listing_id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(
+        Product,
+        related_name='listings',
+        on_delete=models.CASCADE
+    )
+    language_code = models.CharField(max_length=15)
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200)
+    description = models.TextField(blank=True)
+    image = models.ImageField(
+        upload_to='products/%Y/%m/%d',
+        blank=True,
+    )
+    renditions = models.JSONField(default=dict, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    available = models.BooleanField()
+    category_name = models.CharField(max_length=200)
+    category_slug = models.SlugField(max_length=200)
+    created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'language_code'], name='unique_product_listing'
+            ),
+        ]
+        indexes = [
+            # product_detail: lookup by language and slug
+            models.Index(fields=['language_code', 'slug']),
+            # product_list: available products of a language (and category), newest first
+            models.Index(fields=['language_code', 'available', '-created', '-product']),
+            models.Index(fields=['language_code', 'category_slug', 'available', '-created', '-product']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def id(self):
+        return self.product_id
+
+    @property
+    def category(self):
+        return ListingCategory(self.category_name, self.category_slug)
+
+    def get_absolute_url(self):
+        return reverse('shop:product_detail', args=[self.product_id, self.slug])
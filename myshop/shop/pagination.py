@@ -0,0 +1,79 @@
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# Keyset (cursor) pagination of the catalog
+# -----------------------------------------
+# Products are listed newest first, ordered by (-created, -id): the id breaks ties between
+# products created at the same time, so every product has exactly one place in the list.
+# Instead of an OFFSET (which makes the database read and skip every previous row), a page
+# starts after the last product of the previous page:
+#     WHERE created < last.created OR (created = last.created AND id < last.id)
+# which uses the index on -created, so a deep page costs the same as the first one.
+# The position of the last product is given to the client as an opaque "cursor" string.
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(product, id_field='id'):
+    value = f'{product.created.isoformat()}|{getattr(product, id_field)}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the (created, id) position encoded in cursor.
+    Raise InvalidCursor if cursor wasn't made by encode_cursor().
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created, id = value.split('|')
+        return datetime.fromisoformat(created), int(id)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+class KeysetPage:
+    """
+    One page of products, starting after the cursor (or at the beginning).
+    The query only runs when the products are first read, so a page rendered
+    inside a cached template fragment costs nothing when the fragment is cached.
+    id_field is the field that breaks ties between products created at the same time
+    ('product_id' for ProductListing).
+    """
+    def __init__(self, queryset, cursor=None, page_size=None, id_field='id'):
+        self.queryset = queryset.order_by('-created', f'-{id_field}')
+        self.cursor = cursor
+        self.page_size = page_size or settings.CATALOG_PAGE_SIZE
+        self.id_field = id_field
+        if cursor:
+            created, id = decode_cursor(cursor)
+            self.queryset = self.queryset.filter(
+                Q(created__lt=created) | Q(created=created, **{f'{id_field}__lt': id})
+            )
+
+    @cached_property
+    def _rows(self):
+        # one more row than needed tells if there is a next page
+        return list(self.queryset[:self.page_size + 1])
+
+    @property
+    def object_list(self):
+        return self._rows[:self.page_size]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return len(self._rows) > self.page_size
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(self.object_list[-1], self.id_field)
+        return None
@@ -1,5 +1,11 @@
+import hashlib
+import time
+from collections import Counter, defaultdict
+from itertools import groupby
 import redis
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
 from .models import Product
 
 
@@ -10,70 +16,370 @@ r = redis.Redis(
     db=settings.REDIS_DB
 )
 
+# Start of the time-decayed scores (see Recommender.get_weight()). Don't change it once
+# scores have been stored: existing and new scores wouldn't be comparable anymore.
+DECAY_EPOCH = 1735689600    # 2025-01-01 00:00:00 UTC
+
+
 class Recommender:
+    def __init__(self, connection=None):
+        # Use the shared connection unless another one is given (the benchmarks pass their own).
+        self.r = connection if connection is not None else r
+
     def get_product_key(self, id):
         return f'product:{id}:purchased_with'   # Generates a unique Redis key for each product.
 
-    def products_bought(self, products):
+    def get_signature(self, product_ids, versions=None):
+        """
+        Identify a set of products (and the versions of their scores, see get_versions()).
+        The same products always give the same signature, whatever their order,
+        and different sets never share one.
+        """
+        # Sort the ids and join them with a separator, so [1, 23] -> "1,23" and [12, 3] -> "3,12"
+        # can't collide, then hash it to keep the keys short for big carts.
+        signature = ','.join(str(id) for id in sorted(set(product_ids)))
+        if versions:
+            signature += ':' + ','.join(str(version) for version in versions)
+        return hashlib.sha1(signature.encode()).hexdigest()
+
+    def get_union_key(self, product_ids, versions=None):
+        """
+        Key of the combined scores of several products.
+        """
+        return f'temp:union:{self.get_signature(product_ids, versions)}'
+
+    # Cached suggestions
+    # ------------------
+    # suggest_products_for() keeps the suggested products in the Django cache, so hot products
+    # don't touch the Redis sorted sets nor the product table. Every product has a version,
+    # which is part of the cache key of the suggestions for it.
+    # products_bought() changes the version of the bought products: the suggestions cached for
+    # them (alone or in a cart) are not used anymore and expire by themselves.
+    # clear_cache() changes the 'generation', which is part of every cache key: it's called when
+    # all the sets change (clear_purchases(), compact(), rebuild()) and when products are edited.
+    # The versions and the generation are kept in Redis next to the scores, not in the Django
+    # cache: they are changed by the web processes, the Celery workers and the management
+    # commands, and every process must see the change right away.
+
+    GENERATION_KEY = 'recommender:generation'
+
+    def get_version_key(self, id):
+        return f'recommender:version:{id}'
+
+    def get_versions(self, product_ids):
+        """
+        Return the current generation followed by the versions of the given products.
+        """
+        keys = [self.GENERATION_KEY] + [
+            self.get_version_key(id) for id in sorted(set(product_ids))
+        ]
+        versions = self.r.mget(keys)
+        if None in versions:
+            # A version that was never set gets a new unique value, so suggestions cached
+            # under an older one can't be served again. NX: if another process sets it
+            # at the same time, both of them use the first value stored.
+            version = time.time_ns()
+            with self.r.pipeline(transaction=False) as pipe:
+                for key, value in zip(keys, versions):
+                    if value is None:
+                        pipe.set(key, version, nx=True)
+                pipe.mget(keys)
+                versions = pipe.execute()[-1]
+        return [int(version) for version in versions]
+
+    def clear_cache(self):
+        """
+        Stop serving every cached suggestion.
+        """
+        self.r.set(self.GENERATION_KEY, time.time_ns())
+
+    def bump_versions(self, product_ids, pipe=None):
+        """
+        Stop serving the cached suggestions for the given products.
+        Pass a pipeline to send the command with others.
+        """
+        if not product_ids:
+            return
+        version = time.time_ns()
+        (pipe or self.r).mset({self.get_version_key(id): version for id in product_ids})
+
+    def get_suggestions_cache_key(self, product_ids, max_results, versions):
+        signature = self.get_signature(product_ids, versions)
+        return f'recommender:suggestions:{get_language()}:{max_results}:{signature}'
+
+    # Time-decayed scores
+    # -------------------
+    # With settings.RECOMMENDER_DECAY_HALF_LIFE set (in days), a purchase counts half as much
+    # after each half-life. Instead of lowering every stored score all the time, new purchases
+    # are added with a weight that doubles every half-life ("forward decay"): the order of the
+    # members is the same as if the old scores had decayed, and a score divided by the
+    # current weight is its decayed value. compact() uses that to drop near-zero scores.
+    # The weight reaches the float limit after about 1000 half-lives (80 years for 30 days).
+
+    def get_weight(self, timestamp=None):
+        """
+        Return the amount a purchase made at timestamp (default: now) adds to a score.
+        """
+        half_life = settings.RECOMMENDER_DECAY_HALF_LIFE
+        if not half_life:
+            # no decay, every purchase counts 1
+            return 1
+        if timestamp is None:
+            timestamp = time.time()
+        return 2 ** ((timestamp - DECAY_EPOCH) / (half_life * 24 * 60 * 60))
+
+    def products_bought(self, products, bought_at=None):
+        """
+        Record that the products were bought together.
+        • bought_at: optional timestamp of the purchase, used by the time decay. Defaults to now.
+        """
         product_ids = [p.id for p in products]  # This grabs just the numeric IDs for efficiency.
-        for product_id in product_ids:
-            for with_id in product_ids:
-                # get the other products bought with each product
-                if product_id != with_id:
-                    # increment score for product purchased together
-                    r.zincrby(
-                        self.get_product_key(product_id), 1, with_id
-                    )
+        weight = self.get_weight(bought_at)
+        # An order of n products needs n*(n-1) ZINCRBY commands. Instead of waiting for
+        # a reply after each one, they are queued in a pipeline and sent to Redis together,
+        # so the whole order costs a single round trip.
+        # transaction=False: the increments don't need to be applied atomically (no MULTI/EXEC).
+        with self.r.pipeline(transaction=False) as pipe:
+            for product_id in product_ids:
+                for with_id in product_ids:
+                    # get the other products bought with each product
+                    if product_id != with_id:
+                        # increment score for product purchased together
+                        pipe.zincrby(
+                            self.get_product_key(product_id), weight, with_id
+                        )
+            # the scores of these products changed, don't serve their cached suggestions anymore
+            self.bump_versions(product_ids, pipe)
+            pipe.execute()
 
-    def suggest_products_for(self, products, max_results=6):
-        product_ids = [p.id for p in products]
-        if len(products) == 1:
+    def suggest_product_ids(self, product_ids, max_results=6, versions=None):
+        """
+        Return the ids of the products most bought together with the given ones,
+        best first. Only the top members are read from Redis, never the whole set.
+        Pass the versions of the products (see get_versions()) so a combined set
+        stored before their scores changed is not reused.
+        """
+        if not product_ids or max_results <= 0:
+            # zrange(key, 0, -1) would return the whole set
+            return []
+        if len(product_ids) == 1:
             # only 1 product
-            suggestions = r.zrange(
-                self.get_product_key(product_ids[0]), 0, -1, desc=True
-            )[:max_results]
+            suggestions = self.r.zrange(
+                self.get_product_key(product_ids[0]), 0, max_results - 1, desc=True
+            )
             # self.get_product_key(product_ids[0]) -> Get the Redis key (e.g., "product:2:purchased_with")
-            # r.zrange(..., 0, -1, desc=True):
+            # r.zrange(..., 0, max_results - 1, desc=True):
             # -> zrange = Get members from sorted set
-            # -> 0, -1 = From start(0) to end(-1) = All members
+            # -> 0, max_results - 1 = Only the first max_results members (both ends are inclusive)
             # -> desc=True = Descending order (highest score first)
             # Example result: [5,3,7,9,1,4] (product IDs sorted by score)
-            # -> [:max_results]: Take only first 6 items, Result: [5,3,7,9,1,4]
+            # A product is never stored in its own set, so there is nothing to filter out.
 
         else:
-            # generate a temporary key
-            flat_ids = ''.join([str(id) for id in product_ids])
-            # Combine all IDs into one string. Example: [2,3,5] -> "235"
-            temp_key = f'temp_{flat_ids}'
-            # Create a unique temporary key name. Result: "tmp_235"
+            # multiple products, combine scores of all products.
+            # The union is stored under a key derived from the cart composition and left
+            # to expire instead of being deleted, so:
+            # - carts with the same products reuse it until it expires (no ZUNIONSTORE),
+            # - concurrent requests never delete a key another request is reading,
+            #   at worst both of them store the same union.
+            #
+            # The products the recommendation is for are not removed from the union (it's
+            # shared), instead we over-fetch len(product_ids) extra members: even if all of
+            # them are at the top of the union, there are still max_results members left
+            # after filtering them out.
+            union_key = self.get_union_key(product_ids, versions)
+            stop = max_results + len(product_ids) - 1
+            # pipeline() wraps the commands in MULTI/EXEC: one round trip, and the key can't
+            # expire between the EXISTS and the ZRANGE.
+            with self.r.pipeline() as pipe:
+                pipe.exists(union_key)
+                # get the product ids by their score, descendant sort
+                pipe.zrange(union_key, 0, stop, desc=True)
+                exists, suggestions = pipe.execute()
 
-            # multiple products, combine scores of all products
-            # store the resulting sorted set in a temporary key
-            keys = [self.get_product_key(id) for id in product_ids]
-            r.zunionstore(temp_key, keys)
+            if not exists:
+                keys = [self.get_product_key(id) for id in product_ids]
+                with self.r.pipeline() as pipe:
+                    pipe.zunionstore(union_key, keys)
+                    pipe.expire(union_key, settings.RECOMMENDER_UNION_TTL)
+                    pipe.zrange(union_key, 0, stop, desc=True)
+                    _, _, suggestions = pipe.execute()
 
             # remove ids for the products the recommendation is for
-            r.zrem(temp_key, *product_ids)
-            # get the product ids by their score, descendant sort
-            suggestions = r.zrange(
-                temp_key, 0, -1, desc=True
-            )[:max_results]
-            # remove the temporary key
-            r.delete(temp_key)
-
-        suggested_products_ids = [int(id) for id in suggestions]
-        # get suggested products and sort by order of appearance
-        suggested_products = list(
-            Product.objects.filter(id__in=suggested_products_ids)
-        )
-        suggested_products.sort(
-            key=lambda x: suggested_products_ids.index(x.id)
+            excluded_ids = {str(id) for id in product_ids}
+            suggestions = [
+                id for id in suggestions if id.decode() not in excluded_ids
+            ][:max_results]
+
+        return [int(id) for id in suggestions]
+
+    def suggest_products_for(self, products, max_results=6):
+        product_ids = [p.id for p in products]
+        versions = self.get_versions(product_ids)
+        # The products are cached per language, with the active translation already loaded.
+        cache_key = self.get_suggestions_cache_key(product_ids, max_results, versions)
+        suggested_products = cache.get(cache_key)
+        if suggested_products is not None:
+            return suggested_products
+
+        suggested_products_ids = self.suggest_product_ids(
+            product_ids, max_results, versions
         )
+        # get suggested products (with their translations) and sort by order of appearance
+        products_by_id = {
+            product.id: product
+            for product in Product.objects.filter(
+                id__in=suggested_products_ids
+            ).prefetch_related('translations')
+        }
+        suggested_products = [
+            products_by_id[id] for id in suggested_products_ids if id in products_by_id
+        ]
+        cache.set(cache_key, suggested_products, settings.RECOMMENDER_CACHE_TIMEOUT)
 
         return suggested_products
 
 
-    def clear_purchases(self):
-        for id in Product.objects.values_list('id', flat=True):
-            r.delete(self.get_product_key(id))  # You only need IDs for key generation -- no other data to delete it.
+    def clear_purchases(self, batch_size=500, progress=None):
+        """
+        Delete the co-purchase scores of all products and return how many sets were deleted.
+        • batch_size: number of keys found by each SCAN call and deleted by each UNLINK.
+        • progress: optional callable, called with the number of deleted sets after each batch.
+        """
+        # Instead of loading every product id from the database and sending one DELETE per
+        # product, the keys are found with SCAN, which walks the keyspace a few keys at a time
+        # without blocking Redis like KEYS would, and deleted with UNLINK, which frees the
+        # memory in a background thread of Redis. Keys of products removed from the database
+        # are deleted too.
+        deleted = 0
+        batch = []
+        for key in self.r.scan_iter(match=self.get_product_key('*'), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += self.r.unlink(*batch)
+                batch = []
+                if progress:
+                    progress(deleted)
+        if batch:
+            deleted += self.r.unlink(*batch)
+        if progress:
+            progress(deleted)
+        # every cached suggestion is outdated now
+        self.clear_cache()
+        return deleted
+
+    def compact(self, max_members=None, min_score=None, batch_size=500, progress=None):
+        """
+        Trim every co-purchase set to its best max_members members and remove the members
+        whose (decayed) score is below min_score. Return statistics about the work done.
+        • max_members, min_score: default to settings.RECOMMENDER_COMPACT_MAX_MEMBERS and
+          settings.RECOMMENDER_COMPACT_MIN_SCORE.
+        • batch_size: number of sets scanned and trimmed per round trip.
+        • progress: optional callable, called with the number of sets compacted so far.
+        """
+        if max_members is None:
+            max_members = settings.RECOMMENDER_COMPACT_MAX_MEMBERS
+        if min_score is None:
+            min_score = settings.RECOMMENDER_COMPACT_MIN_SCORE
+        # stored scores are weighted by the time of the purchase, see get_weight()
+        threshold = min_score * self.get_weight()
+        memory_before = self.r.info('memory').get('used_memory', 0)
+
+        stats = {'sets': 0, 'removed': 0}
+
+        def compact_batch(keys):
+            with self.r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    # ranks are in ascending score order: remove everything below the
+                    # max_members best ones
+                    pipe.zremrangebyrank(key, 0, -(max_members + 1))
+                    # '(' makes the bound exclusive: scores strictly below the threshold
+                    pipe.zremrangebyscore(key, '-inf', f'({threshold}')
+                removed = pipe.execute()
+            # Redis deletes a sorted set by itself when its last member is removed
+            stats['sets'] += len(keys)
+            stats['removed'] += sum(removed)
+            if progress:
+                progress(stats['sets'])
+
+        batch = []
+        for key in self.r.scan_iter(match=self.get_product_key('*'), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                compact_batch(batch)
+                batch = []
+        if batch:
+            compact_batch(batch)
+
+        memory_after = self.r.info('memory').get('used_memory', 0)
+        # used_memory covers the whole Redis instance, so other writes in the meantime
+        # show up here too: take it as an estimate
+        stats['memory_reclaimed'] = memory_before - memory_after
+        if stats['removed']:
+            # suggestions cached before may include removed members
+            self.clear_cache()
+        return stats
+
+    def rebuild(self, chunk_size=2000, batch_size=1000, progress=None):
+        """
+        Rebuild all co-purchase sets from the paid orders stored in the database,
+        e.g. after the Redis data was lost. Return statistics about the work done.
+        • chunk_size: number of order items fetched from the database at a time.
+        • batch_size: number of set members sent to Redis per round trip.
+        • progress: optional callable, called with the number of orders read so far.
+        """
+        # imported here: orders.models depends on the shop app
+        from orders.models import OrderItem
+
+        start = time.perf_counter()
+        # Read the items of the paid orders in chunks with iterator(), without keeping model
+        # instances around, sorted by order so the items of an order come one after the other.
+        items = OrderItem.objects.filter(
+            order__paid=True
+        ).order_by('order_id').values_list(
+            'order_id', 'product_id', 'order__created'
+        ).iterator(chunk_size=chunk_size)
+
+        # scores[product_id] = Counter({with_id: score, ...}), the same data as the Redis sets
+        scores = defaultdict(Counter)
+        orders = 0
+        for order_id, order_items in groupby(items, key=lambda item: item[0]):
+            order_items = list(order_items)
+            product_ids = {product_id for _, product_id, _ in order_items}
+            weight = self.get_weight(order_items[0][2].timestamp())
+            for product_id in product_ids:
+                for with_id in product_ids:
+                    if product_id != with_id:
+                        scores[product_id][with_id] += weight
+            orders += 1
+            if progress and orders % chunk_size == 0:
+                progress(orders)
+
+        # Everything is counted before touching Redis, so the old sets are only missing
+        # between the clear and the end of the load.
+        self.clear_purchases(batch_size=batch_size)
+        pipe = self.r.pipeline(transaction=False)
+        queued = 0
+        for product_id, with_scores in scores.items():
+            key = self.get_product_key(product_id)
+            members = list(with_scores.items())
+            # ZADD of up to batch_size members at a time, sent when batch_size members are queued
+            for i in range(0, len(members), batch_size):
+                pipe.zadd(key, dict(members[i:i + batch_size]))
+                queued += len(members[i:i + batch_size])
+                if queued >= batch_size:
+                    pipe.execute()
+                    queued = 0
+        pipe.execute()
+        # the sets changed, don't serve the cached suggestions anymore
+        self.clear_cache()
+        if progress:
+            progress(orders)
 
+        seconds = time.perf_counter() - start
+        return {
+            'orders': orders,
+            'sets': len(scores),
+            'seconds': seconds,
+            'orders_per_second': orders / seconds if seconds else 0,
+        }
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from .cache import refresh_catalog
+from .listings import sync_product_listings, use_listings
+from .loaders import forget_slug
+from .models import Category, Product
+from .thumbnails import needs_renditions
+
+
+def catalog_changed(sender, **kwargs):
+    # After the commit: the caches are shared by every process, another one could
+    # otherwise cache the old product again before the change is committed.
+    transaction.on_commit(refresh_catalog)
+
+
+def get_changed_product_ids(sender, instance):
+    """
+    Return the ids of the products whose ProductListing rows depend on instance.
+    """
+    if sender is Product:
+        return [instance.id]
+    if sender is Product._parler_meta.root_model:
+        return [instance.master_id]
+    if sender is Category:
+        category_id = instance.id
+    else:
+        category_id = instance.master_id
+    return list(
+        Product.objects.filter(category_id=category_id).values_list('id', flat=True)
+    )
+
+
+def update_listings(sender, instance, **kwargs):
+    if not use_listings():
+        return
+    if sender in (Product, Category) and kwargs.get('signal') is post_delete:
+        # the ProductListing rows are deleted in cascade with the product
+        return
+    product_ids = get_changed_product_ids(sender, instance)
+    if product_ids:
+        # After the commit: parler saves the translations after the product itself.
+        transaction.on_commit(lambda: sync_product_listings(product_ids))
+
+
+def remember_slug(sender, instance, **kwargs):
+    # the slug before the change, to forget it once the new one is saved
+    instance._previous_slug = sender.objects.filter(pk=instance.pk).values_list(
+        'language_code', 'slug'
+    ).first() if instance.pk else None
+
+
+def product_translation_changed(sender, instance, **kwargs):
+    # the slug -> id mappings of the detail page, the old and the new slug, in every
+    # process: after the commit like the catalog
+    slugs = {(instance.language_code, instance.slug)}
+    if getattr(instance, '_previous_slug', None):
+        slugs.add(instance._previous_slug)
+
+    def forget_slugs():
+        for language, slug in slugs:
+            forget_slug(language, slug)
+    transaction.on_commit(forget_slugs)
+
+
+pre_save.connect(
+    remember_slug, sender=Product._parler_meta.root_model, dispatch_uid='remember_slug'
+)
+for signal in [post_save, post_delete]:
+    signal.connect(
+        product_translation_changed, sender=Product._parler_meta.root_model,
+        dispatch_uid=f'product_translation_changed_{signal is post_save}'
+    )
+
+
+def product_saved(sender, instance, **kwargs):
+    if needs_renditions(instance):
+        # new image: resize it in the background, once the product is in the database
+        from .tasks import generate_product_renditions
+        transaction.on_commit(lambda: generate_product_renditions.delay(instance.id))
+
+
+post_save.connect(product_saved, sender=Product, dispatch_uid='product_saved')
+
+
+# The translated fields (name, slug, description) are saved in the translation models
+# of django-parler, so their changes are watched too.
+for model in [
+    Category,
+    Category._parler_meta.root_model,
+    Product,
+    Product._parler_meta.root_model,
+]:
+    for signal in [post_save, post_delete]:
+        signal.connect(
+            catalog_changed, sender=model,
+            dispatch_uid=f'catalog_changed_{signal is post_save}_{model.__name__}'
+        )
+        signal.connect(
+            update_listings, sender=model,
+            dispatch_uid=f'update_listings_{signal is post_save}_{model.__name__}'
+        )
@@ -0,0 +1,83 @@
+import logging
+from celery import shared_task
+from .cache import refresh_catalog
+from .models import Product
+from .recommender import Recommender
+from .thumbnails import generate_renditions, needs_renditions, save_renditions
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def clear_purchases(self, batch_size=500):
+    """
+    Task to delete the co-purchase scores of all products.
+    The number of sets deleted so far is reported in the task state
+    (state 'PROGRESS', meta {'deleted': n}), so it can be followed from
+    Flower or with AsyncResult(task_id).info.
+    """
+    def report_progress(deleted):
+        self.update_state(state='PROGRESS', meta={'deleted': deleted})
+
+    deleted = Recommender().clear_purchases(
+        batch_size=batch_size, progress=report_progress
+    )
+    logger.info(f'Deleted {deleted} co-purchase sets')
+    return deleted
+
+
+@shared_task(bind=True)
+def compact_purchases(self, max_members=None, min_score=None, batch_size=500):
+    """
+    Periodic task to trim the co-purchase sets, see Recommender.compact().
+    """
+    def report_progress(sets):
+        self.update_state(state='PROGRESS', meta={'sets': sets})
+
+    stats = Recommender().compact(
+        max_members=max_members,
+        min_score=min_score,
+        batch_size=batch_size,
+        progress=report_progress
+    )
+    logger.info(
+        f'Compacted {stats["sets"]} co-purchase sets: removed {stats["removed"]} members, '
+        f'reclaimed {stats["memory_reclaimed"]} bytes of Redis memory'
+    )
+    return stats
+
+
+@shared_task(bind=True)
+def rebuild_recommendations(self, chunk_size=2000, batch_size=1000):
+    """
+    Task to rebuild the co-purchase sets from the paid orders, see Recommender.rebuild().
+    """
+    def report_progress(orders):
+        self.update_state(state='PROGRESS', meta={'orders': orders})
+
+    stats = Recommender().rebuild(
+        chunk_size=chunk_size, batch_size=batch_size, progress=report_progress
+    )
+    logger.info(
+        f'Rebuilt {stats["sets"]} co-purchase sets from {stats["orders"]} orders '
+        f'in {stats["seconds"]:.1f}s ({stats["orders_per_second"]:.0f} orders/s)'
+    )
+    return stats
+
+
+@shared_task
+def generate_product_renditions(product_id):
+    """
+    Task to generate the resized copies of the image of a product, see thumbnails.py.
+    """
+    try:
+        product = Product.objects.get(id=product_id)
+    except Product.DoesNotExist:
+        return None
+    if not needs_renditions(product):
+        return product.renditions
+    renditions = generate_renditions(product.image.name)
+    save_renditions(product.id, renditions)
+    refresh_catalog()
+    return renditions
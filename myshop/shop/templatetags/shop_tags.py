@@ -0,0 +1,25 @@
+from django import template
+from django.core.files.storage import default_storage
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('shop/product/image.html')
+def product_image(product, size):
+    """
+    Render the image of a product (a Product or a ProductListing) at one of the sizes of
+    settings.PRODUCT_IMAGE_RENDITIONS, as WebP with a JPEG fallback. Until the resized
+    copies exist the original image is used. Usage: {% product_image product 'small' %}
+    """
+    context = {'webp': None, 'jpg': None, 'original': None}
+    if product.image:
+        context['original'] = product.image.url
+        renditions = product.renditions
+        # renditions made from a previous image don't count
+        if renditions.get('source') == product.image.name:
+            for extension in ['webp', 'jpg']:
+                name = renditions.get(f'{size}.{extension}')
+                if name:
+                    context[extension] = default_storage.url(name)
+    return context
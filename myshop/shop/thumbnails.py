@@ -0,0 +1,106 @@
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+
+# Product images are uploaded at any resolution, so every image gets smaller copies
+# ("renditions") that the templates serve instead of the original: one per size of
+# settings.PRODUCT_IMAGE_RENDITIONS, in WebP (smallest) and JPEG (for browsers without WebP).
+# They are stored next to the original, named after it with its extension, so images of
+# the same name in other formats (Lemon_Green_Tea.png) don't share renditions:
+#     products/2025/04/08/Lemon_Green_Tea.webp            <- original
+#     products/2025/04/08/Lemon_Green_Tea.webp.small.webp
+#     products/2025/04/08/Lemon_Green_Tea.webp.small.jpg
+# and their names are saved in Product.renditions:
+#     {'source': 'products/.../Lemon_Green_Tea.webp', 'small.webp': '...', 'small.jpg': '...'}
+# 'source' is the image they were made from, to know when the image changed.
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def get_rendition_name(image_name, size, extension):
+    return f'{image_name}.{size}.{extension}'
+
+
+def generate_renditions(image_name):
+    """
+    Generate every rendition of the image stored under image_name and return
+    the names to store in Product.renditions.
+    """
+    renditions = {'source': image_name}
+    with default_storage.open(image_name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+
+    for size, dimensions in settings.PRODUCT_IMAGE_RENDITIONS.items():
+        image = original.copy()
+        # resize to fit in the dimensions keeping the aspect ratio, never enlarge
+        image.thumbnail(dimensions, Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            if options['format'] == 'JPEG' and image.mode != 'RGB':
+                # JPEG has no transparency: put the image on a white background
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                output_image = background
+            else:
+                output_image = image
+            buffer = BytesIO()
+            output_image.save(buffer, **options)
+            name = get_rendition_name(image_name, size, extension)
+            # save() would pick another name if the file already exists
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            renditions[f'{size}.{extension}'] = default_storage.save(
+                name, ContentFile(buffer.getvalue())
+            )
+    return renditions
+
+
+def needs_renditions(product):
+    return bool(product.image) and product.renditions.get('source') != product.image.name
+
+
+def delete_renditions(renditions, keep=()):
+    """
+    Delete the files of the renditions, but for the names in keep.
+    The source image itself belongs to Product.image and is left alone, and so are files
+    not named after it: renditions named before the extension of the source was part of
+    the name can be shared by another image.
+    """
+    prefix = f"{renditions.get('source')}."
+    for key, name in renditions.items():
+        if (
+            key != 'source' and name.startswith(prefix) and name not in keep
+            and default_storage.exists(name)
+        ):
+            default_storage.delete(name)
+
+
+def save_renditions(product_id, renditions):
+    """
+    Store the names returned by generate_renditions() on the product (and its listings)
+    and delete the files of the renditions of its previous image.
+    update() is used so the post_save signals don't run again for the product.
+    The caller invalidates the cached pages, see refresh_catalog() in cache.py.
+    """
+    from .models import Product, ProductListing
+    with transaction.atomic():
+        # lock the product so two saves don't both take the same previous renditions
+        previous = (
+            Product.objects.select_for_update()
+            .filter(id=product_id)
+            .values_list('renditions', flat=True)
+            .first()
+        )
+        Product.objects.filter(id=product_id).update(renditions=renditions)
+        ProductListing.objects.filter(product_id=product_id).update(renditions=renditions)
+    # the previous image may still be the image of another product
+    if previous and not Product.objects.filter(image=previous.get('source')).exists():
+        delete_renditions(previous, keep=set(renditions.values()))
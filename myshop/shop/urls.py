@@ -5,6 +5,12 @@ app_name = 'shop'
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
+    path('api/products/', views.product_list_json, name='product_list_json'),
+    path(
+        'api/products/<slug:category_slug>/',
+        views.product_list_json,
+        name='product_list_json_by_category'
+    ),
     path(
         '<slug:category_slug>/',
         views.product_list,
@@ -1,28 +1,58 @@
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404
-from .models import Category, Product
+from .models import Category, Product, ProductListing
 from cart.forms import CartAddProductForm
-from .recommender import Recommender
+from .cache import get_catalog_version
+from .pagination import InvalidCursor, KeysetPage
+from .listings import use_listings
+from .loaders import load_product_detail
 
 
 
-# It handles:
-# Showing all products if no category is selected.
-# Showing products in a specific category if one is selected via the URL (using the slug).
-def product_list(request, category_slug=None):
+def get_catalog_page(request, category_slug=None):
+    """
+    Return the category (or None) and the page of available products asked for
+    by the 'after' cursor of the query string.
+    """
     category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
+    language = request.LANGUAGE_CODE
+    if use_listings():
+        # one row per product and language, no join with the translation tables
+        products = ProductListing.objects.filter(language_code=language, available=True)
+        id_field = 'product_id'
+    else:
+        # prefetch_related('translations') loads the translations of all the products of the page
+        # in one extra query, instead of one query per product when the template reads name or slug.
+        products = Product.objects.filter(available=True).prefetch_related('translations')
+        id_field = 'id'
     if category_slug:
-        language = request.LANGUAGE_CODE
         # The 'translations' used inside here is from the category model's field.
         # When you query, You're saying: "Find a 'Category' where its related translations table
         # has a row with this language_code and slug".
         category = get_object_or_404(
-            Category,   # <- Main table
+            Category.objects.prefetch_related('translations'),   # <- Main table
             translations__language_code=language,   # <- Query the translations table
             translations__slug=category_slug        # <- Query the translations table
         )
-        products = products.filter(category=category)
+        if use_listings():
+            products = products.filter(category_slug=category_slug)
+        else:
+            products = products.filter(category=category)
+
+    try:
+        page = KeysetPage(products, cursor=request.GET.get('after'), id_field=id_field)
+    except InvalidCursor:
+        raise Http404('Invalid page')
+    return category, page
+
+
+# It handles:
+# Showing all products if no category is selected.
+# Showing products in a specific category if one is selected via the URL (using the slug).
+def product_list(request, category_slug=None):
+    category, page = get_catalog_page(request, category_slug)
+    # Lazy as well: when the page is served from the cache the query is never run.
+    categories = Category.objects.prefetch_related('translations')
 
     return render(
         request,
@@ -30,23 +60,37 @@ def product_list(request, category_slug=None):
         {
             'category': category,
             'categories': categories,
-            'products': products,
+            'page': page,
+            # part of the cache key of the page, changes when the catalog is edited
+            'catalog_version': get_catalog_version(),
         }
     )
 
 
+def product_list_json(request, category_slug=None):
+    """
+    Same pages as product_list, as JSON. Pass the 'next' value as ?after=... to get the next page.
+    """
+    category, page = get_catalog_page(request, category_slug)
+    results = [
+        {
+            'id': product.id,
+            'name': product.name,
+            'slug': product.slug,
+            'price': str(product.price),
+            'url': product.get_absolute_url(),
+            'image': product.image.url if product.image else None,
+        }
+        for product in page
+    ]
+    return JsonResponse({'results': results, 'next': page.next_cursor})
+
+
 def product_detail(request, id, slug):
-    language = request.LANGUAGE_CODE
-    product = get_object_or_404(
-        Product,
-        id=id,
-        translations__language_code=language,
-        translations__slug=slug,
-        available=True
+    product, recommended_products = load_product_detail(
+        request.LANGUAGE_CODE, id, slug
     )
     cart_product_form = CartAddProductForm()
-    r = Recommender()
-    recommended_products = r.suggest_products_for([product], 4)
     return render(
         request,
         'shop/product/detail.html',